@@ -0,0 +1,133 @@
+# bench_codec.py
+"""
+JSON codec benchmark for PriOARity.
+
+Parses and serializes a corpus of OAR configs with every available backend
+(see prioarity_complete.JSON_BACKENDS) and prints the time per pass and the gain over stdlib json:
+  - parse:   codec.loads of every config (what scanning and Run pay);
+  - pretty:  codec.dumps(indent 2) (what Run pays when a priority cannot be spliced);
+  - compact: codec.dumps(compact=True) (scan index, manifest).
+Every backend serializes with the standard json module (so output bytes do not depend
+on the backend); pretty/compact are listed as the baseline for parse.
+
+    python bench_codec.py [--corpus DIR] [--configs N] [--runs N]
+
+Without --corpus a synthetic corpus is generated: mostly small configs with a few
+conditions, some with large condition trees (IsActorBase lists, nested OR/AND), like real packs.
+"""
+import os
+import sys
+import gc
+import time
+import random
+import argparse
+import statistics
+
+import prioarity_complete as core
+
+# доли синтетического корпуса: (число условий, вложенность, доля)
+CORPUS_SHAPES = [(2, 1, 0.70), (12, 2, 0.25), (400, 3, 0.05)]
+
+
+def make_condition(rng, depth):
+    if depth > 1 and rng.random() < 0.3:
+        return {"condition": rng.choice(["OR", "AND"]), "requiredVersion": "1.0.0.0",
+                "Conditions": [make_condition(rng, depth - 1) for _ in range(rng.randint(2, 4))]}
+    kind = rng.choice(["IsActorBase", "HasKeyword", "IsEquippedType", "CompareValues", "IsInFaction"])
+    cond = {"condition": kind, "requiredVersion": "1.0.0.0", "negated": rng.random() < 0.2}
+    if kind in ("IsActorBase", "HasKeyword", "IsInFaction"):
+        cond["Form"] = {"pluginName": rng.choice(["Skyrim.esm", "Dawnguard.esm", "Мой мод.esp"]),
+                        "formID": f"{rng.randint(0, 0xFFFFFF):X}"}
+    elif kind == "IsEquippedType":
+        cond["Type"] = {"value": rng.randint(0, 12)}
+        cond["Left hand"] = rng.random() < 0.5
+    else:
+        cond["Value A"] = {"actorValue": {"actorValue": rng.randint(0, 160), "actorValueType": "Value"}}
+        cond["Comparison"] = rng.choice(["==", "!=", ">", ">=", "<", "<="])
+        cond["Value B"] = {"value": round(rng.uniform(0, 100), 2)}
+    return cond
+
+
+def make_config(rng, conditions, depth):
+    return {"name": f"Moveset {rng.randint(1, 9999)}", "description": "Generated for bench_codec",
+            "priority": rng.randint(1, 2_000_000_000), "disabled": False,
+            "interruptible": rng.random() < 0.5, "replaceOnLoop": True,
+            "conditions": [make_condition(rng, depth) for _ in range(conditions)]}
+
+
+def synthetic_corpus(count, seed=1):
+    rng = random.Random(seed)
+    corpus = []
+    for conditions, depth, share in CORPUS_SHAPES:
+        for _ in range(max(1, int(count * share))):
+            corpus.append(core.StdlibJsonCodec.dumps(make_config(rng, conditions, depth)))
+    return corpus
+
+
+def load_corpus(root):
+    corpus = []
+    for dirpath, _, files in os.walk(root):
+        for name in files:
+            if name.lower() in ("config.json", "user.json"):
+                with open(os.path.join(dirpath, name), "rb") as f:
+                    corpus.append(f.read())
+    return corpus
+
+
+def timed(func, runs):
+    """Медиана времени func() в мс; сборщик мусора на время замеров выключен (как в timeit)."""
+    times = []
+    gc.disable()
+    try:
+        for _ in range(runs):
+            t0 = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - t0)
+    finally:
+        gc.enable()
+    return statistics.median(times) * 1000
+
+
+def bench_backend(codec, corpus, runs):
+    decoded = [codec.loads(raw) for raw in corpus]
+    return {
+        "parse": timed(lambda: [codec.loads(raw) for raw in corpus], runs),
+        "pretty": timed(lambda: [codec.dumps(obj) for obj in decoded], runs),
+        "compact": timed(lambda: [codec.dumps(obj, compact=True) for obj in decoded], runs),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=None, help="folder with real mods (config.json/user.json are collected)")
+    parser.add_argument("--configs", type=int, default=2000, help="synthetic corpus size (default: %(default)s)")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    corpus = load_corpus(args.corpus) if args.corpus else synthetic_corpus(args.configs)
+    if not corpus:
+        print(f"No configs found in {args.corpus}")
+        return 1
+    size_mb = sum(len(raw) for raw in corpus) / 1e6
+    print(f"corpus: {len(corpus)} configs, {size_mb:.1f} MB")
+
+    results = {}
+    for backend in core.JSON_BACKENDS:
+        try:
+            codec = core.make_json_codec(backend)
+        except ImportError:
+            print(f"{backend:8s} not installed, skipped")
+            continue
+        results[backend] = bench_backend(codec, corpus, args.runs)
+
+    base = results["json"]
+    for backend, result in results.items():
+        cells = []
+        for op, ms in result.items():
+            cells.append(f"{op} {ms:8.1f} ms ({size_mb / (ms / 1000):6.0f} MB/s, x{base[op] / ms:4.1f})")
+        print(f"{backend:8s} " + "   ".join(cells))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+# bench_startup.py
+"""
+Startup benchmark for PriOARity.
+
+Measures, each in a fresh interpreter:
+  - core import: `import prioarity_complete` (what the CLI and library users pay);
+  - first window: import + building and showing the mode chooser (what the GUI user sees).
+Also checks that the core import does not pull GUI / msgpack / pool modules.
+
+    python bench_startup.py [--runs N] [--no-gui]
+
+Exits with 1 if a budget is exceeded or a heavy module leaks into the core import.
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+import statistics
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Бюджеты (мс), медиана по запускам
+CORE_IMPORT_BUDGET_MS = 60
+FIRST_WINDOW_BUDGET_MS = 1500
+
+# Модули, которых не должно быть после `import prioarity_complete`
+HEAVY_MODULES = ["FreeSimpleGUI", "tkinter", "msgpack", "shutil", "sqlite3",
+                 "concurrent.futures", "multiprocessing"]
+
+CORE_SNIPPET = """
+import sys, time, json
+t0 = time.perf_counter()
+import prioarity_complete
+t1 = time.perf_counter()
+print(json.dumps({"ms": (t1 - t0) * 1000, "loaded": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+WINDOW_SNIPPET = """
+import time, json
+t0 = time.perf_counter()
+import prioarity_complete
+win = prioarity_complete.build_mode_window()
+win.finalize()
+t1 = time.perf_counter()
+win.close()
+print(json.dumps({"ms": (t1 - t0) * 1000}))
+"""
+
+
+def run_snippet(snippet):
+    proc = subprocess.run([sys.executable, "-c", snippet], cwd=HERE, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit {proc.returncode}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def measure(snippet, runs):
+    results = [run_snippet(snippet) for _ in range(runs)]
+    return statistics.median(r["ms"] for r in results), results[-1]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--no-gui", action="store_true", help="skip the first-window measurement")
+    args = parser.parse_args(argv)
+
+    ok = True
+    run_snippet(CORE_SNIPPET)  # прогрев: компиляция .pyc
+    core_ms, last = measure(CORE_SNIPPET, args.runs)
+    verdict = "OK" if core_ms <= CORE_IMPORT_BUDGET_MS else "OVER BUDGET"
+    print(f"core import:  {core_ms:8.1f} ms  (budget {CORE_IMPORT_BUDGET_MS} ms)  {verdict}")
+    ok &= core_ms <= CORE_IMPORT_BUDGET_MS
+    if last["loaded"]:
+        print(f"  heavy modules loaded by core import: {', '.join(last['loaded'])}")
+        ok = False
+
+    if not args.no_gui:
+        try:
+            window_ms, _ = measure(WINDOW_SNIPPET, args.runs)
+        except RuntimeError as e:
+            print(f"first window: skipped ({e})")
+        else:
+            verdict = "OK" if window_ms <= FIRST_WINDOW_BUDGET_MS else "OVER BUDGET"
+            print(f"first window: {window_ms:8.1f} ms  (budget {FIRST_WINDOW_BUDGET_MS} ms)  {verdict}")
+            ok &= window_ms <= FIRST_WINDOW_BUDGET_MS
+
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,21 +10,57 @@ LOG_ENCODING = "utf-8"
 
 # ==== Helpers ====
 
+def is_oar_dir(parts_lower):
+    """
+    Может ли папка (части пути от корня мода, в нижнем регистре) быть на пути
+    meshes/actors/<проект>/[_1stperson/]animations/OpenAnimationReplacer/... или внутри него.
+    """
+    n = len(parts_lower)
+    if n < 3:
+        return parts_lower == ["meshes", "actors"][:n]
+    i = 4 if parts_lower[3:4] == ["_1stperson"] else 3
+    if n <= i:
+        return True
+    if parts_lower[i] != "animations":
+        return False
+    return n == i + 1 or OAR_KEYWORD.lower() in parts_lower[i + 1]
+
+
+def walk_oar_dirs(mod_path):
+    """
+    Обходит только OAR-папки мода: (root, rel_path, files) для каждой папки внутри
+    .../animations/OpenAnimationReplacer. Открываются только папки на этом пути (см. is_oar_dir),
+    textures, scripts, SKSE... — нет.
+    """
+    stack = [(mod_path, ())]
+    while stack:
+        root, parts = stack.pop()
+        try:
+            with os.scandir(root) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        parts_lower = [p.lower() for p in parts]
+        if any(OAR_KEYWORD.lower() in p for p in parts_lower):
+            yield root, os.path.join(*parts), [e.name for e in entries if e.is_file()]
+        for entry in reversed(entries):
+            # как os.walk: симлинки на папки не обходим (цикл ссылок иначе не кончится)
+            if (entry.is_dir(follow_symlinks=False)
+                    and (len(parts) >= 6 or is_oar_dir(parts_lower + [entry.name.lower()]))):
+                stack.append((entry.path, parts + (entry.name,)))
+
+
 def is_oar_mod(mod_path):
-    """Проверяет, содержит ли мод OAR-анимации."""
-    for root, dirs, _ in os.walk(mod_path):
-        if OAR_KEYWORD in root or OAR_KEYWORD in " ".join(dirs):
-            return True
+    """Проверяет, содержит ли мод OAR-анимации (обход останавливается на первой OAR-папке)."""
+    for _ in walk_oar_dirs(mod_path):
+        return True
     return False
 
 
 def collect_jsons(mod_path):
     """Собирает JSON-файлы внутри OAR-папок."""
     entries = []
-    for root, _, files in os.walk(mod_path):
-        if OAR_KEYWORD not in root:
-            continue
-        rel_path = os.path.relpath(root, mod_path)
+    for root, rel_path, files in walk_oar_dirs(mod_path):
         for file in files:
             if file.lower().endswith(".json"):
                 src_file = os.path.join(root, file)
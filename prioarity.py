@@ -0,0 +1,245 @@
+# prioarity.py
+"""
+PriOARity headless command line (no GUI import).
+
+    python -m prioarity scan  --profile <MO2 profile> [--mods-dir DIR] [--include-dar] [--jobs N]
+    python -m prioarity check --profile <MO2 profile> [--mods-dir DIR] [--include-dar] [--jobs N]
+    python -m prioarity run   --profile <MO2 profile> --out DIR [--start N] [--include-dar] [--mods NAME ...]
+                              [--fill-gaps] [--pin NAME ...] [--zip [--meta-ini]]
+    python -m prioarity plan  --profile <MO2 profile> [--start N] [--mods NAME ...] [--csv FILE]   (dry run)
+
+Exit codes: see EXIT_* below.
+"""
+import os
+import sys
+import json
+import argparse
+from datetime import datetime
+
+import prioarity_complete as core
+
+EXIT_OK = 0         # всё в порядке
+EXIT_CONFLICTS = 1  # check: найдены дубли приоритетов
+EXIT_USAGE = 2      # неверные аргументы (argparse)
+EXIT_INPUT = 3      # профиль / modlist.txt / папка модов не найдены, выходная папка недоступна
+EXIT_PARTIAL = 4    # часть модов не удалось прочитать или записать
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="prioarity", description="Renumber OAR/DAR animation priorities by MO2 load order.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--profile", required=True, help="MO2 profile folder (contains modlist.txt)")
+    common.add_argument("--mods-dir", default="", help="MO2 mods folder (default: <profile>/../../mods)")
+    common.add_argument("--include-dar", action="store_true", help="include DAR Legacy mods")
+    common.add_argument("--jobs", type=int, default=core.scan_worker_count(), help="scan threads (default: %(default)s)")
+    common.add_argument("--index", default=None, help="scan index file (default: per-user cache)")
+    common.add_argument("--no-index", action="store_true", help="do not use the persistent scan index")
+    common.add_argument("--json", action="store_true", help="print a JSON summary to stdout (messages go to stderr)")
+
+    sub.add_parser("scan", parents=[common], help="list detected animation mods in load order")
+    sub.add_parser("check", parents=[common], help="report duplicate priorities (exit code 1 if any)")
+    renumber = argparse.ArgumentParser(add_help=False)
+    renumber.add_argument("--start", type=int, default=1, help="start priority (>= 1, default: 1)")
+    renumber.add_argument("--mods", nargs="+", default=None, help="only these mod folders (default: all detected)")
+    renumber.add_argument("--fill-gaps", action="store_true",
+                          help="keep priorities of mods not being renumbered and place the others into free gaps")
+    renumber.add_argument("--pin", nargs="+", default=[], help="mod folders whose priorities must not change")
+
+    run = sub.add_parser("run", parents=[common, renumber], help="write renumbered configs to <out>/PriOARity_Output")
+    run.add_argument("--out", required=True, help="output folder")
+    run.add_argument("--zip", action="store_true", help=f"write <out>/{core.ARCHIVE_NAME} instead of a folder")
+    run.add_argument("--meta-ini", action="store_true", help="add meta.ini to the archive (with --zip)")
+    plan = sub.add_parser("plan", parents=[common, renumber], help="show what run would write, without writing")
+    plan.add_argument("--csv", default=None, help="also save the full plan (every file) as CSV")
+
+    args = parser.parse_args(argv)
+    if args.command in ("run", "plan") and args.start < 1:
+        parser.error("--start must be >= 1")
+    if args.command == "run" and args.meta_ini and not args.zip:
+        parser.error("--meta-ini requires --zip")
+    if args.jobs < 1:
+        parser.error("--jobs must be >= 1")
+    return args
+
+
+def load_profile(args, say):
+    """Читает профиль и сканирует моды. Возвращает (mods_dir, [folders], {folder: ModScan}) или None."""
+    if not os.path.isdir(args.profile):
+        say(f"Profile folder not found: {args.profile}")
+        return None
+    if not os.path.exists(os.path.join(args.profile, "modlist.txt")):
+        say("modlist.txt not found in profile folder.")
+        return None
+    mods_dir = core.resolve_mo2_mods_dir(args.profile, args.mods_dir)
+    if not os.path.isdir(mods_dir):
+        say(f"Mods folder not found: {mods_dir}")
+        return None
+
+    index = None if args.no_index else core.open_animation_index(args.index)
+    try:
+        scans = core.scan_mods(mods_dir, core.read_mo2_active_mods(args.profile), index=index, workers=args.jobs)
+    finally:
+        if index:
+            index.close()
+    folders = [m for m, scan in scans.items()
+               if scan.mod_type and (args.include_dar or scan.has_oar)]
+    return mods_dir, folders, scans
+
+
+def cmd_scan(args, say):
+    loaded = load_profile(args, say)
+    if loaded is None:
+        return EXIT_INPUT, {}
+    mods_dir, folders, scans = loaded
+    mods = []
+    for i, folder in enumerate(folders, 1):
+        scan = scans[folder]
+        used = scan.used_range_text(args.include_dar)
+        say(f"{i:4d}  {folder}  [{scan.mod_type}]  {used}" + (f"  ERROR: {scan.error}" if scan.error else ""))
+        mods.append({"folder": folder, "type": scan.mod_type, "range": used, "error": scan.error})
+    say(f"{len(folders)} animation mods in {mods_dir}")
+    status = EXIT_PARTIAL if any(m["error"] for m in mods) else EXIT_OK
+    return status, {"mods_dir": mods_dir, "mods": mods}
+
+
+def cmd_check(args, say):
+    loaded = load_profile(args, say)
+    if loaded is None:
+        return EXIT_INPUT, {}
+    mods_dir, folders, scans = loaded
+    conflicts, overlaps = core.analyze_priority_conflicts(mods_dir, folders, include_dar_legacy=args.include_dar,
+                                                         mod_scans=scans, workers=args.jobs)
+    if conflicts:
+        say("Duplicate priority conflicts detected:")
+        for pri, mods in conflicts:
+            say(f" - Priority {pri}: mods: {', '.join(mods)}")
+    else:
+        say("No duplicate priorities detected.")
+    if overlaps:
+        say("Overlapping priority ranges (load order may not be respected):")
+        for overlap in overlaps:
+            say(core.format_range_conflict(overlap))
+    errors = {f: scans[f].error for f in folders if scans[f].error}
+    for folder, error in errors.items():
+        say(f"Error reading '{folder}': {error}")
+    status = EXIT_CONFLICTS if conflicts else (EXIT_PARTIAL if errors else EXIT_OK)
+    return status, {"conflicts": [{"priority": pri, "mods": mods} for pri, mods in conflicts],
+                    "overlaps": [{"kind": kind, "earlier": a, "later": b, "earlier_range": list(ra), "later_range": list(rb)}
+                                 for kind, a, b, ra, rb in overlaps],
+                    "errors": errors}
+
+
+def allocate_blocks(args, say):
+    """Общая часть run/plan: профиль, выбор модов и блоки приоритетов. None — ошибка (уже выведена)."""
+    loaded = load_profile(args, say)
+    if loaded is None:
+        return None
+    mods_dir, all_folders, scans = loaded
+    folders = all_folders
+    if args.mods:
+        wanted = set(args.mods)
+        unknown = sorted(wanted - set(folders))
+        if unknown:
+            say(f"Not detected as animation mods, skipped: {unknown}")
+        folders = [f for f in folders if f in wanted]
+
+    reserved = [f for f in all_folders if f not in folders] if args.fill_gaps else []
+    try:
+        blocks = core.allocate_mod_blocks(folders, scans, args.start, include_dar_legacy=args.include_dar,
+                                          reserved_folders=reserved, pinned_folders=args.pin)
+    except ValueError as e:
+        say(f"Cannot place priorities: {e}")
+        return None
+    return mods_dir, folders, scans, blocks
+
+
+def cmd_plan(args, say):
+    allocated = allocate_blocks(args, say)
+    if allocated is None:
+        return EXIT_INPUT, {}
+    mods_dir, folders, scans, blocks = allocated
+    plan = core.build_run_plan([(mod, mod) for mod in folders], scans, blocks, args.include_dar)
+    for line in core.plan_summary_lines(plan):
+        say(line)
+    pinned = [mod for mod in folders if blocks[mod] is None]
+    if pinned:
+        say(f"  pinned, kept as is: {', '.join(pinned)}")
+    if args.csv:
+        core.export_plan_csv(args.csv, plan)
+        say(f"Plan saved to: {args.csv}")
+    return EXIT_OK, {"blocks": blocks, "files": len(plan), "csv": args.csv}
+
+
+def cmd_run(args, say):
+    allocated = allocate_blocks(args, say)
+    if allocated is None:
+        return EXIT_INPUT, {}
+    mods_dir, folders, scans, blocks = allocated
+
+    out_root = args.out if args.zip else os.path.join(args.out, "PriOARity_Output")
+    # лог пишется в файл по мере работы, в памяти не копится
+    logfile_name = os.path.join(out_root, f"mo2_prio_log_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt")
+    log_lines = core.LogSink(max_lines=0)
+    try:
+        os.makedirs(out_root, exist_ok=True)
+        log_lines.open_file(logfile_name)
+    except OSError as e:
+        say(f"Cannot write to the output folder '{out_root}': {e}")
+        return EXIT_INPUT, {"output": out_root}
+    for mod in folders:
+        if blocks[mod] is None:
+            say(f"Skipping pinned mod '{mod}' (priorities kept)")
+
+    def progress(done, total, mod, scan):
+        if blocks[mod] is not None:
+            say(f"[{done}/{total}] {mod}")
+
+    jobs = [(mod, mod) for mod in folders]
+    try:
+        if args.zip:
+            archive = os.path.join(out_root, core.ARCHIVE_NAME)
+            written, errors, writer = core.run_archive(mods_dir, jobs, scans, blocks, archive, log_lines,
+                                                       include_dar_legacy=args.include_dar, progress=progress,
+                                                       meta_ini=args.meta_ini)
+            files = {"archive": archive, "written": writer.count}
+            say(f"Archive: {writer.count} files written to {archive}")
+        else:
+            written, errors, manifest = core.run_output(mods_dir, jobs, scans, blocks, out_root, log_lines,
+                                                        include_dar_legacy=args.include_dar, progress=progress,
+                                                        workers=args.jobs)
+            files = {"written": manifest.written, "unchanged": manifest.skipped, "removed": manifest.removed}
+            say(f"Output files: {manifest.summary()}")
+    finally:
+        log_lines.close_file()
+    for mod, error in errors.items():
+        say(f"Error processing '{mod}': {error}")
+    last_priority = max([blocks[f] + core.mod_block_size(scans[f], args.include_dar) - 1 for f in written],
+                        default=args.start - 1)
+    renumbered = len(written)
+    say(f"Done! {renumbered} mods, priorities {args.start} - {last_priority}. Log saved to: {logfile_name}")
+    status = EXIT_PARTIAL if errors else EXIT_OK
+    return status, {"output": out_root, "log": logfile_name, "mods": folders,
+                    "blocks": blocks, "last_priority": last_priority, "errors": errors, "files": files}
+
+
+COMMANDS = {"scan": cmd_scan, "check": cmd_check, "plan": cmd_plan, "run": cmd_run}
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    stream = sys.stderr if args.json else sys.stdout
+
+    def say(text):
+        print(text, file=stream)
+
+    status, summary = COMMANDS[args.command](args, say)
+    if args.json:
+        summary = dict(summary, command=args.command, status=status)
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,17 +1,31 @@
 # prioarity_complete.py
 import os
+import sys
 import json
-import re
-import shutil
-import msgpack
-import FreeSimpleGUI as sg
+import re  # json всё равно импортирует re, откладывать его бессмысленно
+import bisect
+import threading  # лок пула разбора нужен на уровне модуля
+from array import array
 from datetime import datetime
+# Тяжёлые модули (FreeSimpleGUI/tkinter, msgpack, shutil, sqlite3, concurrent.futures)
+# импортируются в функциях, которым они нужны: CLI и импорт как библиотеки их не грузят.
+# Время старта контролирует bench_startup.py.
 
 # ==== Config / constants ====
 OAR_KEYWORD = "OpenAnimationReplacer"
 DAR_KEYWORD = "DynamicAnimationReplacer"
 LOG_ENCODING = "utf-8"
 
+# Число потоков сканирования по типу диска: на HDD параллельные чтения
+# упираются в seek, поэтому потоков мало
+SCAN_WORKERS = {"SSD": 8, "HDD": 2}
+DEFAULT_DISK_TYPE = "SSD"
+
+# Большие паки (тысячи сабмодов в одном моде) разбираются пулом процессов;
+# ниже порога — в процессе, чтобы маленькие моды не платили за запуск пула
+PARSE_POOL_THRESHOLD = 2000
+PARSE_SHARD_SIZE = 250
+
 # Типы анимационных модов
 class ModType:
     OAR = "OAR"
@@ -19,6 +33,94 @@ class ModType:
     DAR_LEGACY_ACTOR = "DAR Legacy (Actor)"
     MIXED = "Mixed"
 
+# ==== JSON codec ====
+
+# Бэкенд JSON: быстрый (orjson), если установлен, иначе стандартный json.
+# PRIOARITY_JSON=json принудительно включает стандартный (например, для сравнения).
+JSON_BACKEND_ENV = "PRIOARITY_JSON"
+JSON_BACKENDS = ("orjson", "json")
+
+class StdlibJsonCodec:
+    """
+    Стандартный json. dumps возвращает UTF-8 байты: компактно или с отступом 2 и переводами
+    строк os.linesep — те же байты, что прежняя запись json.dump в текстовом режиме (CRLF на Windows).
+    """
+    name = "json"
+
+    @staticmethod
+    def loads(data):
+        return json.loads(data)
+
+    @staticmethod
+    def dumps(obj, compact=False):
+        if compact:
+            return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        text = json.dumps(obj, ensure_ascii=False, indent=2)
+        if os.linesep != "\n":
+            text = text.replace("\n", os.linesep)  # "\n" внутри строк json экранирует
+        return text.encode("utf-8")
+
+# 19 цифр подряд: возможно целое за пределами 64 бит (или просто длинная строка цифр).
+# Цифры заменяются на "0" и ищется подстрока — на порядок быстрее регулярного выражения.
+_DIGITS_TO_ZERO = bytes.maketrans(b"123456789", b"000000000")
+_LONG_DIGITS = b"0" * 19
+
+def _has_long_digits(data):
+    if not isinstance(data, (bytes, bytearray)):
+        data = data.encode("utf-8", "surrogatepass")
+    return data.translate(_DIGITS_TO_ZERO).find(_LONG_DIGITS) >= 0
+
+class OrjsonCodec(StdlibJsonCodec):
+    """
+    orjson для разбора. То, что orjson не принимает (NaN/Infinity в файле, одиночные суррогаты),
+    и документы с длинными целыми (orjson молча делает из них float) разбирает стандартный json.
+    dumps — всегда стандартный json: orjson пишет NaN как null и иначе форматирует float,
+    а вывод Run не должен зависеть от бэкенда.
+    """
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+        self._orjson = orjson
+
+    def loads(self, data):
+        if _has_long_digits(data):
+            return json.loads(data)
+        try:
+            return self._orjson.loads(data)
+        except self._orjson.JSONDecodeError:
+            return json.loads(data)
+
+def make_json_codec(backend=None):
+    """Кодек по имени из JSON_BACKENDS; None — первый доступный. Неустановленный бэкенд — ImportError."""
+    if backend == "json":
+        return StdlibJsonCodec()
+    if backend not in (None, "orjson"):
+        raise ValueError(f"Unknown JSON backend: {backend}")
+    try:
+        return OrjsonCodec()
+    except ImportError:
+        if backend:
+            raise
+        return StdlibJsonCodec()
+
+_JSON_CODEC = None
+
+def json_codec():
+    """Кодек процесса (выбирается при первом вызове, чтобы импорт модуля не грузил orjson)."""
+    global _JSON_CODEC
+    if _JSON_CODEC is None:
+        try:
+            _JSON_CODEC = make_json_codec(os.environ.get(JSON_BACKEND_ENV) or None)
+        except (ImportError, ValueError) as e:
+            print(f"JSON backend unavailable, using json: {e}", file=sys.stderr)
+            _JSON_CODEC = StdlibJsonCodec()
+    return _JSON_CODEC
+
+def read_json_file(path):
+    with open(path, "rb") as f:
+        return json_codec().loads(f.read())
+
 # ==== Shared helpers ====
 
 def is_oar_root_path(path_str):
@@ -54,6 +156,835 @@ def parse_conditions_txt(conditions_file):
     except Exception:
         return None
 
+# ==== Persistent scan index ====
+
+INDEX_FILENAME = "prioarity_index.sqlite"
+INDEX_SCHEMA_VERSION = 1
+
+def default_index_path():
+    """Путь к индексу по умолчанию: %LOCALAPPDATA%\\PriOARity (или ~/.cache/PriOARity)."""
+    base = os.environ.get("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "PriOARity", INDEX_FILENAME)
+
+class AnimationIndex:
+    """
+    Персистентный индекс результатов сканирования (SQLite).
+
+    dirs:  листинг каждой папки мода, ключ — путь + mtime папки
+           (mtime папки меняется при добавлении/удалении/переименовании файлов в ней).
+    files: результат разбора config.json/user.json ([has_priority, priority]) и
+           _conditions.txt (строка условий), ключ — путь + mtime + размер файла.
+
+    Повторное сканирование неизменившегося мода — только stat() папок и json-файлов.
+    Объект можно использовать из нескольких потоков.
+    """
+
+    def __init__(self, db_path):
+        import sqlite3
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        folder = os.path.dirname(db_path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'schema'").fetchone()
+            if row is None or row[0] != str(INDEX_SCHEMA_VERSION):
+                self._conn.execute("DROP TABLE IF EXISTS dirs")
+                self._conn.execute("DROP TABLE IF EXISTS files")
+                self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('schema', ?)", (str(INDEX_SCHEMA_VERSION),))
+            self._conn.execute("CREATE TABLE IF NOT EXISTS dirs (mod TEXT, rel TEXT, mtime_ns INTEGER, "
+                               "subdirs TEXT, files TEXT, PRIMARY KEY (mod, rel))")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS files (mod TEXT, rel TEXT, mtime_ns INTEGER, "
+                               "size INTEGER, value TEXT, PRIMARY KEY (mod, rel))")
+
+    @staticmethod
+    def mod_key(mod_path):
+        return os.path.normcase(os.path.abspath(mod_path))
+
+    def load_mod(self, mod_path):
+        """Возвращает (dirs, files) мода: {rel: (mtime_ns, subdirs, files)}, {rel: (mtime_ns, size, value)}."""
+        key = self.mod_key(mod_path)
+        with self._lock:
+            dir_rows = self._conn.execute("SELECT rel, mtime_ns, subdirs, files FROM dirs WHERE mod = ?", (key,)).fetchall()
+            file_rows = self._conn.execute("SELECT rel, mtime_ns, size, value FROM files WHERE mod = ?", (key,)).fetchall()
+        loads = json_codec().loads
+        dirs = {rel: (mtime, loads(subdirs), loads(files)) for rel, mtime, subdirs, files in dir_rows}
+        files = {rel: (mtime, size, loads(value)) for rel, mtime, size, value in file_rows}
+        return dirs, files
+
+    def store_mod(self, mod_path, dirs, files):
+        """Полностью заменяет записи мода (устаревшие пути удаляются)."""
+        key = self.mod_key(mod_path)
+        codec = json_codec()
+
+        def dumps(value):
+            return codec.dumps(value, compact=True).decode("utf-8")
+        dir_rows = [(key, rel, mtime, dumps(subdirs), dumps(names)) for rel, (mtime, subdirs, names) in dirs.items()]
+        file_rows = [(key, rel, mtime, size, dumps(value)) for rel, (mtime, size, value) in files.items()]
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM dirs WHERE mod = ?", (key,))
+            self._conn.execute("DELETE FROM files WHERE mod = ?", (key,))
+            self._conn.executemany("INSERT INTO dirs VALUES (?, ?, ?, ?, ?)", dir_rows)
+            self._conn.executemany("INSERT INTO files VALUES (?, ?, ?, ?, ?)", file_rows)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def open_animation_index(db_path=None):
+    """Открывает индекс (по умолчанию default_index_path()). При ошибке возвращает None — сканирование работает и без него."""
+    try:
+        return AnimationIndex(db_path or default_index_path())
+    except Exception as e:
+        print(f"Scan index disabled: {e}", file=sys.stderr)
+        return None
+
+class _IndexedMod:
+    """Обёртка над индексом на время одного scan_mod: отдаёт листинги/результаты из кэша, если stat совпал."""
+
+    def __init__(self, index, mod_path):
+        self.index = index
+        self.mod_path = mod_path
+        self.old_dirs, self.old_files = index.load_mod(mod_path) if index else ({}, {})
+        self.dirs = {}
+        self.files = {}
+        self.dirty = False
+
+    def list_dir(self, root, rel):
+        """(subdirs, files) папки; при совпадении mtime — без scandir."""
+        mtime = None
+        if self.index:
+            mtime = os.stat(root).st_mtime_ns
+            cached = self.old_dirs.get(rel)
+            if cached and cached[0] == mtime:
+                self.dirs[rel] = cached
+                return cached[1], cached[2]
+        dirs = []
+        files = []
+        with os.scandir(root) as it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    continue
+                if is_dir:
+                    # как os.walk(followlinks=False): симлинки не обходим
+                    if not entry.is_symlink():
+                        dirs.append(entry.name)
+                else:
+                    files.append(entry.name)
+        dirs.sort()
+        files.sort()
+        if self.index:
+            self.dirs[rel] = (mtime, dirs, files)
+            self.dirty = True
+        return dirs, files
+
+    def get_file(self, path, rel):
+        """(stamp, cached_value): cached_value is None, если файла нет в индексе или он изменился."""
+        if not self.index:
+            return None, None
+        st = os.stat(path)
+        stamp = (st.st_mtime_ns, st.st_size)
+        cached = self.old_files.get(rel)
+        if cached and (cached[0], cached[1]) == stamp:
+            return stamp, cached[2]
+        return stamp, None
+
+    def put_file(self, rel, stamp, value):
+        if not self.index:
+            return
+        old = self.old_files.get(rel)
+        if not old or (old[0], old[1]) != stamp or old[2] != value:
+            self.dirty = True
+        self.files[rel] = (stamp[0], stamp[1], value)
+
+    def save(self, merge=False):
+        """merge=True — дописать к тому, что уже есть в индексе (проход видел не все папки и файлы мода)."""
+        if not self.index:
+            return
+        if merge:
+            if self.dirty:
+                self.index.store_mod(self.mod_path, dict(self.old_dirs, **self.dirs), dict(self.old_files, **self.files))
+            return
+        if self.dirty or self.dirs.keys() != self.old_dirs.keys() or self.files.keys() != self.old_files.keys():
+            self.index.store_mod(self.mod_path, self.dirs, self.files)
+
+# ==== Priority extraction ====
+
+# строки JSON и скобки: всё остальное между ними для поиска ключа верхнего уровня неважно
+_JSON_TOKEN_RE = re.compile(rb'"(?:[^"\\]|\\.)*"|[{}\[\]]')
+_PRIORITY_VALUE_RE = re.compile(rb'\s*:\s*(-?\d+)(?=\s*[,}])')
+
+def find_priority_span(raw):
+    """
+    Байтовый диапазон (start, end) целого значения ключа "priority" верхнего уровня в raw.
+    None — если такого ключа нет, он не один или значение не целое число.
+    Корректность JSON здесь не проверяется (вызывающий разбирает файл сам, см. patch_priority);
+    разбор идёт только до последнего вхождения "priority" в тексте (обычно ключ в начале).
+    """
+    last = raw.rfind(b'"priority"')
+    if last < 0:
+        return None
+    depth = 0
+    span = None
+    for m in _JSON_TOKEN_RE.finditer(raw):
+        if m.start() > last:
+            break
+        token = m.group()
+        if token in (b"{", b"["):
+            depth += 1
+        elif token in (b"}", b"]"):
+            depth -= 1
+        elif depth == 1 and token == b'"priority"':
+            value = _PRIORITY_VALUE_RE.match(raw, m.end())
+            if value is None:
+                if raw[m.end():].lstrip()[:1] == b":":
+                    return None  # ключ с нецелым значением
+                continue  # строка "priority" — значение, а не ключ
+            if span is not None:
+                return None
+            span = value.span(1)
+    return span
+
+def read_priority(src_file):
+    """
+    [has_priority, priority] верхнего уровня config.json. Файл разбирается целиком (битый JSON —
+    ошибка чтения), но dict сразу отбрасывается: в памяти не копятся деревья условий всех модов.
+    """
+    data = read_json_file(src_file)
+    has_priority = "priority" in data
+    return [has_priority, data["priority"] if has_priority else None]
+
+# ==== Single-pass mod scanner ====
+
+_INT64_MIN, _INT64_MAX = -(1 << 63), (1 << 63) - 1
+
+class _InternedColumn:
+    """Колонка строк с повторами: уникальные значения один раз + array('l') их номеров."""
+    __slots__ = ("values", "_index", "ids")
+
+    def __init__(self):
+        self.values = []
+        self._index = {}
+        self.ids = array("l")
+
+    def append(self, value):
+        i = self._index.get(value)
+        if i is None:
+            i = self._index[value] = len(self.values)
+            self.values.append(value)
+        self.ids.append(i)
+
+    def __getitem__(self, i):
+        return self.values[self.ids[i]]
+
+    def reorder(self, order):
+        self.ids = array("l", (self.ids[i] for i in order))
+
+class _PackedStrings:
+    """Колонка разных строк: один общий буфер + array('q') смещений, без объекта str на запись."""
+    __slots__ = ("_chunks", "_blob", "_offsets")
+
+    def __init__(self, values=()):
+        self._chunks = list(values)
+        self._blob = ""
+        self._offsets = array("q", [0])
+        end = 0
+        for value in self._chunks:
+            end += len(value)
+            self._offsets.append(end)
+        self.pack()
+
+    def append(self, value):
+        self._chunks.append(value)
+        self._offsets.append(self._offsets[-1] + len(value))
+
+    def pack(self):
+        if self._chunks:
+            self._blob += "".join(self._chunks)
+            self._chunks = []
+
+    def __getitem__(self, i):
+        self.pack()
+        return self._blob[self._offsets[i]:self._offsets[i + 1]]
+
+    def reordered(self, order):
+        self.pack()
+        blob, offsets = self._blob, self._offsets
+        return _PackedStrings([blob[offsets[i]:offsets[i + 1]] for i in order])
+
+class OarEntries:
+    """
+    OAR-записи мода по колонкам: папка rel_path = родитель (interned) + последний компонент
+    (общий буфер), имя файла (interned) и приоритет в array('q'); нецелые и не влезающие
+    в int64 значения лежат в словаре _odd.
+    Индексация и итерация отдают прежние кортежи collect_jsons
+    (src_file, rel_path, filename, None, old_priority); строки собираются на лету.
+    """
+    __slots__ = ("mod_path", "_parents", "_leaves", "_files", "priorities", "_odd")
+
+    def __init__(self, mod_path):
+        self.mod_path = mod_path
+        self._parents = _InternedColumn()
+        self._leaves = _PackedStrings()
+        self._files = _InternedColumn()
+        self.priorities = array("q")
+        self._odd = {}
+
+    def append(self, rel_path, file, priority):
+        if type(priority) is int and _INT64_MIN <= priority <= _INT64_MAX:
+            self.priorities.append(priority)
+        else:
+            self._odd[len(self.priorities)] = priority
+            self.priorities.append(0)
+        parent, leaf = os.path.split(rel_path)
+        self._parents.append(parent)
+        self._leaves.append(leaf)
+        self._files.append(file)
+
+    def priority(self, i):
+        return self._odd.get(i, self.priorities[i]) if self._odd else self.priorities[i]
+
+    def rel_path(self, i):
+        return os.path.join(self._parents[i], self._leaves[i])
+
+    def __len__(self):
+        return len(self.priorities)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        rel_path, file = self.rel_path(i), self._files[i]
+        return (os.path.join(self.mod_path, rel_path, file), rel_path, file, None, self.priority(i))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def sort_by_priority(self):
+        """Стабильная сортировка по приоритету; заодно упаковывает буфер строк."""
+        order = sorted(range(len(self)), key=self.priority if self._odd else self.priorities.__getitem__)
+        if all(i == j for i, j in enumerate(order)):
+            self._leaves.pack()
+            return
+        self._parents.reorder(order)
+        self._leaves = self._leaves.reordered(order)
+        self._files.reorder(order)
+        self.priorities = array("q", (self.priorities[i] for i in order))
+        if self._odd:
+            self._odd = {new: self._odd[old] for new, old in enumerate(order) if old in self._odd}
+
+    def int_priorities(self):
+        """Приоритеты, приводимые к int (как в _int_range)."""
+        if not self._odd:
+            return self.priorities
+        return [v for v in (_as_int(self.priority(i)) for i in range(len(self))) if v is not None]
+
+    def signature(self):
+        return tuple((self.rel_path(i), self._files[i], self.priority(i)) for i in range(len(self)))
+
+class DarEntries:
+    """
+    DAR Legacy записи мода по колонкам: папка, priority (array('q')), условие, число .hkx
+    (array('q')) и тип ("custom" / "actor"). Индексация и итерация отдают прежние
+    кортежи collect_dar_legacy_entries (см. _make_dar_entry), собранные на лету.
+    """
+    __slots__ = ("src_dirs", "priorities", "conditions", "hkx_counts", "types")
+
+    def __init__(self):
+        self.src_dirs = []
+        self.priorities = array("q")
+        self.conditions = []
+        self.hkx_counts = array("q")
+        self.types = []
+
+    def append(self, src_dir, priority, condition, hkx_count, entry_type):
+        self.src_dirs.append(src_dir)
+        self.priorities.append(priority)
+        self.conditions.append(condition)
+        self.hkx_counts.append(hkx_count)
+        self.types.append(sys.intern(entry_type))
+
+    def __len__(self):
+        return len(self.priorities)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        src_dir = self.src_dirs[i]
+        return _make_dar_entry(src_dir, self.priorities[i], self.conditions[i], self.hkx_counts[i], self.types[i],
+                               os.path.basename(os.path.dirname(src_dir)), os.path.basename(src_dir))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def sort_by_priority(self):
+        order = sorted(range(len(self)), key=self.priorities.__getitem__)
+        for name in self.__slots__:
+            column = getattr(self, name)
+            values = [column[i] for i in order]
+            setattr(self, name, array("q", values) if isinstance(column, array) else values)
+
+    def count(self, entry_type):
+        return self.types.count(entry_type)
+
+    def signature(self):
+        return tuple(zip(self.src_dirs, self.priorities, self.types))
+
+class ModScan:
+    """
+    Результат одного прохода по папке мода (см. scan_mod).
+
+    oar_entries: OarEntries, записи как у collect_jsons — (src_file, rel_path, filename, None, old_priority);
+                 config.json не держится в памяти (см. read_priority, load_entry_data)
+    dar_entries: DarEntries, записи как у collect_dar_legacy_entries —
+                 (src_dir, rel_path, filename, data_dict, priority, condition, hkx_count, entry_type)
+    error: текст первой ошибки чтения JSON (тогда oar_entries пуст, как при RuntimeError в collect_jsons)
+    """
+
+    def __init__(self, mod_path):
+        self.mod_path = mod_path
+        self.has_oar = False
+        self.has_dar_custom = False
+        self.has_dar_actor = False
+        self.oar_entries = OarEntries(mod_path)
+        self.dar_entries = DarEntries()
+        self.oar_range = None  # (min, max) или None
+        self.dar_range = None
+        self.error = None
+        self.file_count = 0  # файлов просмотрено при обходе (для скорости в прогрессе)
+        self.from_manifest = False  # построен по записям деплоя (scan_mod_from_deployment), а не обходом диска
+
+    @property
+    def mod_type(self):
+        """Тип мода (ModType.*) или None, логика как у detect_mod_type."""
+        has_dar = self.has_dar_custom or self.has_dar_actor
+        if self.has_oar and has_dar:
+            return ModType.MIXED
+        if self.has_oar:
+            return ModType.OAR
+        if self.has_dar_custom and self.has_dar_actor:
+            return ModType.MIXED
+        if self.has_dar_custom:
+            return ModType.DAR_LEGACY_CUSTOM
+        if self.has_dar_actor:
+            return ModType.DAR_LEGACY_ACTOR
+        return None
+
+    @property
+    def priority_min(self):
+        lows = [r[0] for r in (self.oar_range, self.dar_range) if r]
+        return min(lows) if lows else None
+
+    @property
+    def priority_max(self):
+        highs = [r[1] for r in (self.oar_range, self.dar_range) if r]
+        return max(highs) if highs else None
+
+    def used_range_text(self, include_dar=True):
+        """Строка для колонки "Used priorities": '90000 - 90100 + 500 - 510 (DAR)'."""
+        text = f"{self.oar_range[0]} - {self.oar_range[1]}" if self.oar_range else ""
+        if include_dar and self.dar_range:
+            dar_text = f"{self.dar_range[0]} - {self.dar_range[1]} (DAR)"
+            text = f"{text} + {dar_text}" if text else dar_text
+        return text
+
+
+def _as_int(value):
+    try:
+        return int(value)
+    except Exception:
+        return None
+
+def _int_range(values):
+    ints = [v for v in map(_as_int, values) if v is not None]
+    return (min(ints), max(ints)) if ints else None
+
+def _to_signed_priority(folder_name):
+    """Имя папки _CustomConditions/<N> -> знаковый 32-битный приоритет (как в OAR) или None."""
+    try:
+        priority = int(folder_name)
+    except ValueError:
+        return None
+    if priority == 0:
+        return None  # 0 невалиден для CustomConditions
+    if priority > 2147483647:
+        priority = priority - 4294967296  # конвертация unsigned -> signed
+    return priority
+
+def _make_dar_entry(src_dir, priority, condition, hkx_count, entry_type, mod_name=None, form_id=None):
+    """Виртуальная запись DAR Legacy в формате collect_dar_legacy_entries."""
+    if entry_type == "custom":
+        rel_path = f"meshes\\actors\\character\\animations\\{DAR_KEYWORD}\\_CustomConditions\\{priority}"
+        filename = f"dar_config_priority_{priority}.json"
+    else:  # actor
+        rel_path = f"meshes\\actors\\character\\animations\\{DAR_KEYWORD}\\{mod_name}\\{form_id}"
+        filename = f"dar_config_actorbase_{form_id}.json"
+
+    data = {
+        "priority": priority,
+        "dar_legacy": True,
+        "dar_type": entry_type,
+        "hkx_count": hkx_count
+    }
+    if condition:
+        data["condition"] = condition
+    return (src_dir, rel_path, filename, data, priority, condition, hkx_count, entry_type)
+
+def _scan_dar_folder(scan, view, root, rel, actor_parts, files):
+    """
+    Разбирает одну папку внутри meshes/actors с DynamicAnimationReplacer в пути.
+    actor_parts: части пути относительно meshes/actors.
+    """
+    hkx_count = sum(1 for f in files if f.lower().endswith(".hkx"))
+    if not hkx_count:
+        return
+
+    # _CustomConditions/<priority>/
+    if any("_CustomConditions" in p for p in actor_parts):
+        current_folder = actor_parts[-1]
+        if current_folder.lower() == "_customconditions":
+            return
+        priority = _to_signed_priority(current_folder)
+        if priority is None:
+            return
+        condition = None
+        if "_conditions.txt" in (f.lower() for f in files):
+            conditions_file = os.path.join(root, "_conditions.txt")
+            try:
+                stamp, condition = view.get_file(conditions_file, rel + "/_conditions.txt")
+            except OSError:
+                stamp = None
+            if condition is None:
+                condition = parse_conditions_txt(conditions_file)
+            if stamp:
+                view.put_file(rel + "/_conditions.txt", stamp, condition)
+        scan.dar_entries.append(root, priority, condition, hkx_count, "custom")
+        scan.has_dar_custom = True
+        return
+
+    # ActorBase: <project>/animations/DynamicAnimationReplacer/<Mod.esp>/<FormID>
+    if len(actor_parts) >= 5 and actor_parts[2].lower() == DAR_KEYWORD.lower():
+        mod_name = actor_parts[-2]
+        form_id = actor_parts[-1]
+        if len(form_id) == 8 and all(c in "0123456789ABCDEFabcdef" for c in form_id):
+            condition = f'IsActorBase("{mod_name}"|{form_id})'
+            scan.dar_entries.append(root, 0, condition, hkx_count, "actor")
+            scan.has_dar_actor = True
+
+def is_animation_dir(parts_lower):
+    """
+    Может ли папка (части пути от корня мода, в нижнем регистре) быть на пути
+    meshes/actors/<проект>/[_1stperson/]animations/<OAR|DAR>/... или внутри него.
+    Всё остальное (textures, scripts, SKSE, meshes/armor, ...) обходчик не открывает.
+    """
+    n = len(parts_lower)
+    if n < 3:
+        return parts_lower == ["meshes", "actors"][:n]
+    i = 4 if parts_lower[3:4] == ["_1stperson"] else 3
+    if n <= i:
+        return True
+    if parts_lower[i] != "animations":
+        return False
+    if n == i + 1:
+        return True
+    return OAR_KEYWORD.lower() in parts_lower[i + 1] or DAR_KEYWORD.lower() in parts_lower[i + 1]
+
+def mod_type_known(scan):
+    """Дальнейший обход уже не изменит scan.mod_type (для scan_mod(until=...))."""
+    return ((scan.has_oar and (scan.has_dar_custom or scan.has_dar_actor))
+            or (scan.has_dar_custom and scan.has_dar_actor))
+
+def scan_mod(mod_path, parse_json=True, index=None, until=None):
+    """
+    Один проход os.scandir по папке мода: тип мода, OAR-записи (с приоритетами),
+    DAR Legacy записи и диапазоны приоритетов. Открываются только папки на пути
+    meshes/actors/*/[_1stperson/]animations/{OAR,DAR} (см. is_animation_dir).
+    parse_json=False — только определение типа и DAR-структуры, без чтения config.json.
+    until(scan) -> True — остановить обход (только при parse_json=False, когда
+                  ответ уже известен: см. mod_type_known); записи тогда неполные.
+    index: AnimationIndex — неизменившиеся папки и файлы берутся из индекса без чтения.
+    Из config.json берётся только priority (read_priority), data_dict у OAR-записей = None.
+    Ошибки чтения JSON не бросаются, а сохраняются в ModScan.error.
+    """
+    scan = ModScan(mod_path)
+    if not os.path.isdir(mod_path):
+        return scan
+
+    view = _IndexedMod(index, mod_path)
+    json_files = []  # (src_file, rel_path, filename, rel_file) в порядке обхода
+    # стек (абсолютный путь, части относительного пути)
+    stack = [(mod_path, ())]
+    while stack:
+        root, parts = stack.pop()
+        rel = "/".join(parts)
+        try:
+            dirs, files = view.list_dir(root, rel)
+        except OSError:
+            continue
+        scan.file_count += len(files)
+        parts_lower = _scan_folder(scan, view, root, parts, rel, files, json_files if parse_json else None)
+
+        if until is not None and not parse_json and until(scan):
+            break
+        # с 6-го уровня посещённая папка уже внутри OAR/DAR-папки: фильтровать детей незачем
+        for d in reversed(dirs):
+            if len(parts) >= 6 or is_animation_dir(parts_lower + [d.lower()]):
+                stack.append((os.path.join(root, d), parts + (d,)))
+
+    return _finish_scan(scan, view, json_files, save=parse_json)
+
+def _scan_folder(scan, view, root, parts, rel, files, json_files):
+    """
+    Разбор одной папки мода (parts — части пути от корня мода, files — имена файлов в ней).
+    JSON из OAR-папок дописываются в json_files (None — не собирать). Возвращает parts в нижнем регистре.
+    """
+    parts_lower = [p.lower() for p in parts]
+    if any(OAR_KEYWORD.lower() in p for p in parts_lower):
+        scan.has_oar = True
+        if json_files is not None:
+            rel_path = os.path.join(*parts)
+            for file in files:
+                if file.lower().endswith(".json"):
+                    json_files.append((os.path.join(root, file), rel_path, file, rel + "/" + file))
+
+    if (len(parts) > 2 and parts_lower[0] == "meshes" and parts_lower[1] == "actors"
+            and any(DAR_KEYWORD.lower() in p for p in parts_lower[2:])):
+        _scan_dar_folder(scan, view, root, rel, parts[2:], files)
+    return parts_lower
+
+def _finish_scan(scan, view, json_files, save=True, merge=False):
+    """Приоритеты OAR-записей, сохранение в индекс, сортировка и диапазоны."""
+    if json_files:
+        _collect_oar_entries(scan, view, json_files)
+
+    if scan.error:
+        scan.oar_entries = OarEntries(scan.mod_path)
+    elif save:
+        # неполный проход (parse_json=False) не должен затирать файлы в индексе
+        view.save(merge=merge)
+    # sort by old priority to keep stable ordering when rewriting
+    scan.oar_entries.sort_by_priority()
+    scan.dar_entries.sort_by_priority()
+    scan.oar_range = _int_range(scan.oar_entries.int_priorities())
+    scan.dar_range = _int_range(scan.dar_entries.priorities)
+    return scan
+
+def scan_mod_from_deployment(mod_path, rel_paths, index=None):
+    """
+    ModScan по путям файлов мода из деплоя Vortex (relPath относительно Data), без обхода папок:
+    тип мода, OAR-конфиги и DAR-структура берутся из путей, с диска читаются только
+    config.json/user.json (если их нет в индексе) и _conditions.txt.
+    Порядок папок — как у scan_mod (отсортированный обход в глубину).
+    В деплое только файлы, победившие в конфликтах: папку, перекрытую другим модом, так не увидеть,
+    поэтому скан помечается from_manifest (предварительный: тип, таблица, предпросмотр плана и подсветка
+    при сортировке) и заменяется сканом с диска для затронутых модов на Check, Export plan и Run.
+    """
+    scan = ModScan(mod_path)
+    scan.from_manifest = True
+    if not os.path.isdir(mod_path):
+        return scan
+
+    folders = {}  # части пути папки -> имена файлов
+    for rel_path in rel_paths:
+        parts = tuple(p for p in str(rel_path).replace("\\", "/").split("/") if p)
+        if len(parts) > 1:
+            folders.setdefault(parts[:-1], []).append(parts[-1])
+
+    view = _IndexedMod(index, mod_path)
+    json_files = []
+    for parts in sorted(folders):
+        if not is_animation_dir([p.lower() for p in parts]):
+            continue  # scan_mod сюда не заходит (например SKSE/Plugins/OpenAnimationReplacer)
+        files = sorted(set(folders[parts]))
+        scan.file_count += len(files)
+        _scan_folder(scan, view, os.path.join(mod_path, *parts), parts, "/".join(parts), files, json_files)
+    return _finish_scan(scan, view, json_files, merge=True)
+
+def _collect_oar_entries(scan, view, json_files):
+    """
+    Заполняет scan.oar_entries: неизменившиеся файлы берутся из индекса, у остальных извлекается
+    priority (read_priority) — в процессе или, если их не меньше PARSE_POOL_THRESHOLD, пулом процессов.
+    При первой ошибке (в порядке обхода) заполняет scan.error.
+    """
+    results = [None] * len(json_files)  # (stamp, [has_priority, priority] | исключение)
+    pending = []
+    for i, (src_file, _, _, rel_file) in enumerate(json_files):
+        try:
+            stamp, cached = view.get_file(src_file, rel_file)
+        except OSError as e:
+            results[i] = (None, e)
+            continue
+        if cached is not None:
+            results[i] = (stamp, cached)
+        else:
+            pending.append(i)
+            results[i] = (stamp, None)
+
+    if len(pending) >= PARSE_POOL_THRESHOLD:
+        parsed = _parse_priorities_in_pool([json_files[i][0] for i in pending])
+        if parsed is not None:
+            for i, (ok, value) in zip(pending, parsed):
+                results[i] = (results[i][0], value if ok else RuntimeError(value))
+            pending = []
+
+    for i in pending:
+        try:
+            value = read_priority(json_files[i][0])
+        except Exception as e:
+            value = e
+        results[i] = (results[i][0], value)
+
+    for (src_file, rel_path, file, rel_file), (stamp, value) in zip(json_files, results):
+        if isinstance(value, Exception):
+            scan.error = f"Read error {src_file}: {value}"
+            return
+        if stamp:
+            view.put_file(rel_file, stamp, value)
+        has_priority, old_pri = value
+        if not has_priority:
+            # skip meta jsons without priority
+            continue
+        scan.oar_entries.append(rel_path, file, old_pri)
+
+# ==== Process pool for huge mods ====
+
+_PARSE_POOL = None
+_PARSE_POOL_LOCK = threading.Lock()  # пул создаётся и останавливается из потоков run_parallel
+
+def _parse_priority_shard(paths):
+    """Выполняется в процессе пула: извлекает priority из json'ов, возвращает (ok, [has_priority, priority] | ошибка)."""
+    out = []
+    for src_file in paths:
+        try:
+            out.append((True, read_priority(src_file)))
+        except Exception as e:
+            out.append((False, str(e)))
+    return out
+
+def _get_parse_pool():
+    """Пул процессов разбора (создаётся один раз). Вызывающий работает с возвращённой ссылкой."""
+    global _PARSE_POOL
+    with _PARSE_POOL_LOCK:
+        if _PARSE_POOL is None:
+            import atexit
+            from concurrent.futures import ProcessPoolExecutor
+            _PARSE_POOL = ProcessPoolExecutor()
+            atexit.register(shutdown_parse_pool)
+        return _PARSE_POOL
+
+def shutdown_parse_pool(pool=None):
+    """
+    Останавливает пул процессов разбора JSON (если он запускался).
+    pool — остановить, только если глобальный пул всё ещё этот: поток, у которого пул сломался,
+    не останавливает новый пул, уже созданный другим потоком.
+    """
+    global _PARSE_POOL
+    with _PARSE_POOL_LOCK:
+        if _PARSE_POOL is None or (pool is not None and _PARSE_POOL is not pool):
+            return
+        pool, _PARSE_POOL = _PARSE_POOL, None
+    # ожидание процессов — вне лока, чтобы не держать другие потоки
+    pool.shutdown(cancel_futures=True)
+
+def _parse_priorities_in_pool(paths):
+    """
+    Разбирает paths пулом процессов шардами по PARSE_SHARD_SIZE.
+    Возвращает список (ok, value) в порядке paths или None, если пул недоступен (тогда разбор идёт в процессе).
+    """
+    shards = [paths[i:i + PARSE_SHARD_SIZE] for i in range(0, len(paths), PARSE_SHARD_SIZE)]
+    pool = None
+    try:
+        pool = _get_parse_pool()
+        results = []
+        for shard_result in pool.map(_parse_priority_shard, shards):
+            results.extend(shard_result)
+        return results
+    except Exception as e:
+        print(f"JSON parse pool unavailable, parsing in-process: {e}", file=sys.stderr)
+        if pool is not None:
+            shutdown_parse_pool(pool)
+        return None
+
+def load_entry_data(src_file):
+    """Читает config.json OAR-записи целиком (сканирование оставляет data_dict = None)."""
+    try:
+        return read_json_file(src_file)
+    except Exception as e:
+        raise RuntimeError(f"Read error {src_file}: {e}")
+
+# ==== Parallel scan engine ====
+
+def scan_worker_count(disk_type=None):
+    """Число потоков для типа диска ("SSD"/"HDD")."""
+    return SCAN_WORKERS.get(disk_type or DEFAULT_DISK_TYPE, SCAN_WORKERS[DEFAULT_DISK_TYPE])
+
+class OperationCancelled(Exception):
+    """Операция остановлена по запросу пользователя (cancel.set())."""
+
+def run_parallel(func, items, workers=1, progress=None, cancel=None):
+    """
+    Выполняет func(item) для каждого item в пуле потоков.
+    Результаты возвращаются списком в порядке items (детерминированно при любом числе потоков).
+    progress(done, total, item, result) вызывается в вызывающем потоке по мере завершения задач.
+    cancel: threading.Event — после его установки новые item не начинаются,
+            уже начатые дорабатываются, затем бросается OperationCancelled.
+    Исключение из func пробрасывается.
+    """
+    items = list(items)
+    total = len(items)
+    if workers <= 1 or total <= 1:
+        results = []
+        for done, item in enumerate(items, 1):
+            if cancel is not None and cancel.is_set():
+                raise OperationCancelled()
+            results.append(func(item))
+            if progress:
+                progress(done, total, item, results[-1])
+        return results
+
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    results = [None] * total
+    with ThreadPoolExecutor(max_workers=min(workers, total)) as pool:
+        futures = {pool.submit(func, item): i for i, item in enumerate(items)}
+        for done, future in enumerate(as_completed(futures), 1):
+            i = futures[future]
+            results[i] = future.result()
+            if progress:
+                progress(done, total, items[i], results[i])
+            if cancel is not None and cancel.is_set():
+                for pending in futures:
+                    pending.cancel()
+                raise OperationCancelled()
+    return results
+
+def scan_mods(mods_dir, folders, parse_json=True, index=None, workers=1, progress=None, cancel=None):
+    """Сканирует папки модов (параллельно при workers > 1). Возвращает dict folder -> ModScan в порядке folders."""
+    folders = list(folders)
+    scans = run_parallel(lambda folder: scan_mod(os.path.join(mods_dir, folder), parse_json=parse_json, index=index),
+                         folders, workers=workers, progress=progress, cancel=cancel)
+    return dict(zip(folders, scans))
+
+def build_used_ranges(sources, source_to_folder, mod_scans, include_dar=True):
+    """Колонка "Used priorities": dict source -> строка диапазона (только для уже отсканированных папок)."""
+    used_ranges = {}
+    for src in sources:
+        scan = mod_scans.get(source_to_folder.get(src))
+        if scan is None:
+            continue
+        text = scan.used_range_text(include_dar)
+        if text:
+            used_ranges[src] = text
+    return used_ranges
+
 def scan_dar_legacy_structure(mod_path):
     """
     Сканирует мод на наличие DAR Legacy структуры.
@@ -64,196 +995,445 @@ def scan_dar_legacy_structure(mod_path):
     folder_type: "custom" для _CustomConditions/<priority>/
                  "actor" для <Mod.esp>/<FormID>/
     """
-    results = []
-    
-    # Поиск папок meshes/actors/*/animations/DynamicAnimationReplacer
-    dar_base = os.path.join(mod_path, "meshes", "actors")
-    if not os.path.isdir(dar_base):
-        return results
-    
-    for root, dirs, files in os.walk(dar_base):
-        if DAR_KEYWORD.lower() not in root.replace("/", "\\").lower():
-            continue
-        
-        # Проверка на _CustomConditions
-        if "_CustomConditions" in root:
-            # Имя текущей папки должно быть приоритетом
-            current_folder = os.path.basename(root)
-            
-            # Пропускаем саму папку _CustomConditions
-            if current_folder.lower() == "_customconditions":
-                continue
-            
-            # Пытаемся извлечь приоритет из имени папки
-            try:
-                priority = int(current_folder)
-                if priority == 0:
-                    continue  # 0 невалиден для CustomConditions
-                
-                # Конвертируем в знаковое 32-битное число (как в OAR)
-                if priority > 2147483647:
-                    priority = priority - 4294967296  # конвертация unsigned -> signed
-            except ValueError:
-                continue
-            
-            # Парсинг _conditions.txt
-            conditions_file = os.path.join(root, "_conditions.txt")
-            condition = parse_conditions_txt(conditions_file)
-            
-            # Сбор .hkx файлов
-            hkx_files = [f for f in files if f.lower().endswith(".hkx")]
-            
-            if hkx_files:
-                results.append((priority, condition, len(hkx_files), "custom"))
-        
-        else:
-            # ActorBase структура: .../DynamicAnimationReplacer/<Mod.esp>/<FormID>/
-            # priority = 0
-            rel_path = os.path.relpath(root, dar_base)
-            parts = rel_path.replace("/", "\\").split("\\")
-            
-            # Ожидаем структуру: <project>/animations/DynamicAnimationReplacer/<Mod.esp>/<FormID>
-            if len(parts) >= 5 and parts[2].lower() == DAR_KEYWORD.lower():
-                mod_name = parts[-2]  # например, Skyrim.esm
-                form_id = parts[-1]    # например, 00000007
-                
-                # Проверка, что form_id — 8-значный hex
-                if len(form_id) == 8 and all(c in "0123456789ABCDEFabcdef" for c in form_id):
-                    condition = f'IsActorBase("{mod_name}"|{form_id})'
-                    hkx_files = [f for f in files if f.lower().endswith(".hkx")]
-                    
-                    if hkx_files:
-                        results.append((0, condition, len(hkx_files), "actor"))
-    
-    return results
+    scan = scan_mod(mod_path, parse_json=False)
+    dar = scan.dar_entries
+    return list(zip(dar.priorities, dar.conditions, dar.hkx_counts, dar.types))
 
 def detect_mod_type(mod_path):
     """
     Определяет тип мода: OAR, DAR Legacy или смешанный.
     Возвращает ModType.*
     """
-    has_oar = is_oar_mod(mod_path)
-    
-    dar_legacy_results = scan_dar_legacy_structure(mod_path)
-    has_dar = len(dar_legacy_results) > 0
-    
-    if has_oar and has_dar:
-        return ModType.MIXED
-    elif has_oar:
-        return ModType.OAR
-    elif has_dar:
-        # Определяем тип DAR Legacy
-        has_custom = any(r[3] == "custom" for r in dar_legacy_results)
-        has_actor = any(r[3] == "actor" for r in dar_legacy_results)
-        
-        if has_custom and has_actor:
-            return ModType.MIXED
-        elif has_custom:
-            return ModType.DAR_LEGACY_CUSTOM
-        else:
-            return ModType.DAR_LEGACY_ACTOR
-    
-    return None
+    return scan_mod(mod_path, parse_json=False, until=mod_type_known).mod_type
 
 def is_oar_mod(mod_path):
     """Проверяет, содержит ли мод OAR-анимации."""
-    try:
-        for root, dirs, _ in os.walk(mod_path):
-            if OAR_KEYWORD in root or OAR_KEYWORD in " ".join(dirs):
-                return True
-    except Exception:
-        return False
-    return False
+    return scan_mod(mod_path, parse_json=False, until=lambda scan: scan.has_oar).has_oar
 
 def collect_jsons(mod_path):
     """
     Собирает JSON-файлы внутри OAR-папок.
-    Возвращает список (src_file, rel_path, filename, data_dict, old_priority).
+    Возвращает список (src_file, rel_path, filename, None, old_priority) — сам json не хранится,
+    при необходимости читается load_entry_data.
     Пропускает json'ы без поля 'priority'.
     """
-    entries = []
-    for root, _, files in os.walk(mod_path):
-        if OAR_KEYWORD.lower() not in root.replace("/", "\\").lower():
-            continue
-        rel_path = os.path.relpath(root, mod_path)
-        for file in files:
-            if not file.lower().endswith(".json"):
-                continue
-            src_file = os.path.join(root, file)
-            try:
-                with open(src_file, encoding=LOG_ENCODING) as f:
-                    data = json.load(f)
-                if "priority" not in data:
-                    # skip meta jsons without priority
-                    continue
-                old_pri = data["priority"]
-            except Exception as e:
-                # bubble up so caller can decide to skip mod or notify user
-                raise RuntimeError(f"Read error {src_file}: {e}")
-            entries.append((src_file, rel_path, file, data, old_pri))
-    # sort by old priority to keep stable ordering when rewriting
-    entries.sort(key=lambda x: x[4])
-    return entries
+    scan = scan_mod(mod_path)
+    if scan.error:
+        # bubble up so caller can decide to skip mod or notify user
+        raise RuntimeError(scan.error)
+    return scan.oar_entries
 
 def collect_dar_legacy_entries(mod_path):
     """
     Собирает DAR Legacy записи из структуры мода.
     Возвращает список виртуальных entries:
-    (virtual_src, rel_path, filename, data_dict, priority, condition, hkx_count, entry_type)
+    (src_dir, rel_path, filename, data_dict, priority, condition, hkx_count, entry_type)
     
+    src_dir — исходная папка DAR в моде (самого json-файла нет, запись виртуальная).
     entry_type: "custom" для _CustomConditions, "actor" для ActorBase
     """
-    entries = []
-    dar_results = scan_dar_legacy_structure(mod_path)
-    
-    for priority, condition, hkx_count, entry_type in dar_results:
-        # Создаём виртуальную запись
-        if entry_type == "custom":
-            # Для CustomConditions создаём структуру с приоритетом
-            rel_path = f"meshes\\actors\\character\\animations\\{DAR_KEYWORD}\\_CustomConditions\\{priority}"
-            filename = f"dar_config_priority_{priority}.json"
-        else:  # actor
-            # Извлекаем mod name и form_id из condition
-            # Формат: IsActorBase("ModName.esp"|FormID)
-            import re
-            match = re.search(r'IsActorBase\("([^"]+)"\|([0-9A-Fa-f]+)\)', condition or "")
-            if match:
-                mod_name = match.group(1)
-                form_id = match.group(2)
-                rel_path = f"meshes\\actors\\character\\animations\\{DAR_KEYWORD}\\{mod_name}\\{form_id}"
-                filename = f"dar_config_actorbase_{form_id}.json"
-            else:
-                rel_path = f"meshes\\actors\\character\\animations\\{DAR_KEYWORD}\\actorbase_{priority}"
-                filename = f"dar_config_actorbase_{priority}.json"
-        
-        # Создаём виртуальный data dict
-        data = {
-            "priority": priority,
-            "dar_legacy": True,
-            "dar_type": entry_type,
-            "hkx_count": hkx_count
-        }
-        if condition:
-            data["condition"] = condition
-        
-        # virtual_src = None (так как это виртуальная запись)
-        entries.append((None, rel_path, filename, data, priority, condition, hkx_count, entry_type))
-    
-    # Сортируем по приоритету
-    entries.sort(key=lambda x: x[4])
-    return entries
+    return scan_mod(mod_path, parse_json=False).dar_entries
 
 def get_mod_animation_entries(mod_path):
     """
     Получает все анимационные записи из мода (OAR + DAR Legacy).
     Возвращает (oar_entries, dar_entries, mod_type)
     """
-    mod_type = detect_mod_type(mod_path)
-    oar_entries = collect_jsons(mod_path) if mod_type in (ModType.OAR, ModType.MIXED) else []
-    dar_entries = collect_dar_legacy_entries(mod_path) if mod_type in (ModType.DAR_LEGACY_CUSTOM, ModType.DAR_LEGACY_ACTOR, ModType.MIXED) else []
-    return oar_entries, dar_entries, mod_type
+    scan = scan_mod(mod_path)
+    if scan.error:
+        raise RuntimeError(scan.error)
+    return scan.oar_entries, scan.dar_entries, scan.mod_type
+
+# ==== Run plan ====
+
+DAR_OUTPUT_ROOT = os.path.join("meshes", "actors", "character", "animations", DAR_KEYWORD)
+
+def _plan_oar(scan, priority_counter):
+    rows = []
+    for entry in scan.oar_entries:
+        _, rel_path, file, _, old_pri = entry
+        rows.append(("oar", entry, old_pri, priority_counter, os.path.join(rel_path, file)))
+        priority_counter += 1
+    return rows, priority_counter
+
+def _plan_dar(scan, priority_counter):
+    rows = []
+    for entry in scan.dar_entries:
+        src_dir, old_priority, entry_type = entry[0], entry[4], entry[7]
+        if entry_type == "custom":
+            target = os.path.join(DAR_OUTPUT_ROOT, "_CustomConditions", str(priority_counter), "user.json")
+            rows.append(("custom", entry, old_priority, priority_counter, target))
+            priority_counter += 1
+        else:
+            # ActorBase: <Mod.esp>/<FormID>, priority = 0
+            mod_name = os.path.basename(os.path.dirname(src_dir))
+            form_id = os.path.basename(src_dir)
+            rows.append(("actor", entry, 0, 0, os.path.join(DAR_OUTPUT_ROOT, mod_name, form_id, "user.json")))
+    return rows, priority_counter
 
-def copy_dar_legacy_mod(mod_folder_path, out_dir, mod_display_name, start_priority, log_lines):
+def plan_mod(scan, start_priority, include_dar_legacy=False):
+    """
+    Что Run запишет для мода, начиная с start_priority, — только по результату сканирования, без диска.
+    Возвращает [(kind, entry, old_priority, new_priority, target_rel)]:
+      kind: "oar" | "custom" | "actor"; entry — запись из scan.oar_entries / scan.dar_entries;
+      target_rel — путь файла относительно выходной папки.
+    """
+    rows, priority_counter = _plan_oar(scan, start_priority)
+    if include_dar_legacy:
+        rows += _plan_dar(scan, priority_counter)[0]
+    return rows
+
+def build_run_plan(jobs, mod_scans, blocks, include_dar_legacy=False):
+    """
+    Полный план Run для jobs [(имя, folder)] и блоков allocate_mod_blocks:
+    [(name, folder, kind, source_path, old_priority, new_priority, target_rel)], kind как у plan_mod.
+    Закреплённые и не отсканированные моды в план не входят.
+    """
+    plan = []
+    for name, folder in jobs:
+        start = blocks.get(folder)
+        scan = mod_scans.get(folder)
+        if start is None or scan is None:
+            continue
+        for kind, entry, old_priority, new_priority, target in plan_mod(scan, start, include_dar_legacy):
+            plan.append((name, folder, kind, entry[0], old_priority, new_priority, target))
+    return plan
+
+def _range_text(values):
+    values = [v for v in values if isinstance(v, int)]
+    if not values:
+        return "-"
+    lo, hi = min(values), max(values)
+    return str(lo) if lo == hi else f"{lo} – {hi}"
+
+def plan_summary_lines(plan):
+    """
+    Сводка плана по модам: 'name: old → new (N files)' и итоговая строка.
+    DAR ActorBase (всегда priority 0) в диапазоны не входят.
+    """
+    per_mod = {}
+    for name, _, kind, _, old_priority, new_priority, _ in plan:
+        olds, news, files = per_mod.setdefault(name, ([], [], [0]))
+        files[0] += 1
+        if kind != "actor":
+            olds.append(old_priority)
+            news.append(new_priority)
+    ordered = [r[5] for r in plan if r[2] != "actor"]
+    lines = [f"Plan: {len(per_mod)} mods, {len(plan)} files, new priorities {_range_text(ordered)}"]
+    for name, (olds, news, files) in per_mod.items():
+        lines.append(f"  {name}: {_range_text(olds)} → {_range_text(news)} ({files[0]} files)")
+    return lines
+
+def export_plan_csv(path, plan):
+    import csv
+    with open(path, "w", encoding=LOG_ENCODING, newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["mod", "folder", "kind", "source", "old_priority", "new_priority", "target"])
+        writer.writerows(plan)
+
+def _replace_atomically(dst_file, write):
+    """write(f) пишет во временный файл рядом с dst_file, затем он атомарно заменяет dst_file."""
+    tmp = dst_file + ".tmp"
+    try:
+        with open(tmp, "wb") as f:
+            write(f)
+        os.replace(tmp, dst_file)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+def _write_bytes_file(dst_file, payload):
+    _replace_atomically(dst_file, lambda f: f.write(payload))
+
+def _copy_file(src_file, dst_file):
+    import shutil
+    with open(src_file, "rb") as src:
+        _replace_atomically(dst_file, lambda f: shutil.copyfileobj(src, f))
+    shutil.copystat(src_file, dst_file)
+
+class OutputWriter:
+    """
+    Запись файлов Run: каждая папка создаётся один раз, файлы пишутся во временный
+    файл и атомарно переименовываются (прерванный Run не оставляет недописанных JSON).
+    При workers > 1 запись идёт в пуле потоков; flush() дожидается её и вызывает
+    done-колбэки в вызывающем потоке в порядке write_bytes — результат не зависит от числа потоков.
+    """
+
+    def __init__(self, workers=1):
+        self._dirs = set()
+        self._pending = []
+        self._pool = None
+        if workers > 1:
+            from concurrent.futures import ThreadPoolExecutor
+            self._pool = ThreadPoolExecutor(max_workers=workers)
+
+    def makedirs(self, path):
+        if path not in self._dirs:
+            os.makedirs(path, exist_ok=True)
+            self._dirs.add(path)
+
+    def write_bytes(self, dst_file, payload, done=None):
+        """done() вызывается после успешной записи (в flush, если запись в пуле)."""
+        self.makedirs(os.path.dirname(dst_file))
+        if self._pool is None:
+            _write_bytes_file(dst_file, payload)
+            if done:
+                done()
+        else:
+            self._pending.append((self._pool.submit(_write_bytes_file, dst_file, payload), done))
+
+    def copy_file(self, src_file, dst_file):
+        """Синхронная атомарная копия (результат нужен сразу)."""
+        self.makedirs(os.path.dirname(dst_file))
+        _copy_file(src_file, dst_file)
+
+    def flush(self):
+        """Дожидается всех записей; бросает первую ошибку записи (колбэки успешных записей уже вызваны)."""
+        pending, self._pending = self._pending, []
+        first_error = None
+        for future, done in pending:
+            try:
+                future.result()
+            except Exception as e:
+                first_error = first_error or e
+                continue
+            if done:
+                done()
+        if first_error is not None:
+            raise first_error
+
+    def close(self):
+        if self._pool is not None:
+            self._pending = []
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+ARCHIVE_NAME = "PriOARity_Output.zip"
+META_INI = "[General]\nmodid=0\nversion=\nnewestVersion=\ncategory=\ninstallationFile=\ncomments=Generated by PriOARity\n"
+
+class ZipOutputWriter:
+    """
+    То же, что OutputWriter, но файлы Run сразу идут в .zip-архив, без промежуточной папки
+    (out_dir для _write_plan_row — пустая строка, пути в архиве — пути плана).
+    Сжатие — в отдельном потоке, пока Run готовит следующие файлы. Архив собирается
+    во временном файле и заменяет archive_path только в close(commit=True).
+    Путь, записанный повторно (патч-мод перекрывает конфиг более раннего мода), в архиве
+    остаётся один — от последней записи, как в папке вывода.
+    """
+
+    def __init__(self, archive_path):
+        import queue
+        import zipfile
+        self.archive_path = archive_path
+        self.count = 0  # файлов в архиве (без повторов)
+        self._names = set()
+        self._shadowed = False  # были повторные имена — перед заменой архива убрать старые записи
+        self._tmp = archive_path + ".tmp"
+        self._zip = zipfile.ZipFile(self._tmp, "w", compression=zipfile.ZIP_DEFLATED)
+        self._queue = queue.Queue(maxsize=256)
+        self._pending = []
+        self._error = None
+        self._thread = threading.Thread(target=self._compress, daemon=True)
+        self._thread.start()
+
+    def _compress(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                if self._error is None:
+                    name, data, duplicate = item
+                    if duplicate:
+                        self._write_duplicate(name, data)
+                    else:
+                        self._zip.writestr(name, data)
+            except Exception as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _write_duplicate(self, name, data):
+        import warnings
+        # повторное имя ожидаемо и убирается в close() (_drop_shadowed): предупреждение zipfile лишнее
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", UserWarning)
+            self._zip.writestr(name, data)
+
+    def makedirs(self, path):
+        pass  # в архиве папки не создаются
+
+    def _put(self, dst_file, data):
+        name = dst_file.replace(os.sep, "/")
+        duplicate = name in self._names
+        if duplicate:
+            self._shadowed = True
+        self._names.add(name)
+        self._queue.put((name, data, duplicate))
+
+    def write_bytes(self, dst_file, payload, done=None):
+        self._put(dst_file, payload)
+        self._pending.append(done)
+
+    def copy_file(self, src_file, dst_file):
+        with open(src_file, "rb") as f:
+            self._put(dst_file, f.read())
+        self._pending.append(None)
+
+    def flush(self):
+        """Дожидается сжатия всех поставленных файлов; бросает ошибку записи архива."""
+        self._queue.join()
+        if self._error is not None:
+            raise OSError(f"Archive write error {self.archive_path}: {self._error}")
+        pending, self._pending = self._pending, []
+        self.count = len(self._names)
+        for done in pending:
+            if done:
+                done()
+
+    def close(self, commit=True):
+        """commit=False (Run отменён или упал) — временный архив удаляется, прежний остаётся."""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        self._zip.close()
+        if commit and self._error is None:
+            if self._shadowed:
+                self._drop_shadowed()
+            os.replace(self._tmp, self.archive_path)
+        else:
+            try:
+                os.remove(self._tmp)
+            except OSError:
+                pass
+
+    def _drop_shadowed(self):
+        """Пересобирает временный архив, оставляя для каждого имени только последнюю запись."""
+        import zipfile
+        tmp = self._tmp + ".dedup"
+        with zipfile.ZipFile(self._tmp) as src, zipfile.ZipFile(tmp, "w", compression=zipfile.ZIP_DEFLATED) as dst:
+            latest = {}
+            for info in src.infolist():
+                latest[info.filename] = info
+            for info in latest.values():
+                dst.writestr(info, src.read(info))
+        os.replace(tmp, self._tmp)
+
+def _plan_row_inputs(kind, entry, new_priority):
+    """Ключ входных данных файла плана: меняется всякий раз, когда может измениться вывод."""
+    src = entry[0]
+    stamp = "-"
+    if kind != "actor":
+        try:
+            st = os.stat(src if kind == "oar" else os.path.join(src, "_conditions.txt"))
+            stamp = f"{st.st_mtime_ns}:{st.st_size}"
+        except OSError:
+            pass
+    return f"{kind}|{src}|{stamp}|{new_priority}"
+
+def patch_priority(raw, old_priority, new_priority):
+    """
+    Исходные байты config.json с заменённым числом priority (форматирование автора сохраняется).
+    raw должен быть уже проверен разбором (find_priority_span корректность JSON не проверяет).
+    None — если безопасно заменить нельзя (тогда нужен полный json.load / json.dumps).
+    """
+    span = find_priority_span(raw)
+    if span is None or not isinstance(old_priority, int) or int(raw[span[0]:span[1]]) != old_priority:
+        return None
+    return raw[:span[0]] + str(new_priority).encode("ascii") + raw[span[1]:]
+
+def _write_plan_row(out_dir, mod_display_name, row, log_lines, journal=None, manifest=None, writer=None):
+    """
+    Записывает один файл плана (см. plan_mod) через writer (OutputWriter).
+    manifest: OutputManifest — файл не переписывается, если не изменились входные данные
+              или получившееся содержимое.
+    """
+    kind, entry, old_priority, new_priority, target = row
+    if kind == "oar":
+        log_line = f"[{mod_display_name}] {entry[0]} : {old_priority} → {new_priority}"
+    elif kind == "custom":
+        log_line = f"[{mod_display_name}] DAR Custom: priority {old_priority} → {new_priority}"
+    else:
+        parts = target.split(os.sep)
+        log_line = f"[{mod_display_name}] DAR ActorBase: {parts[-3]}\\{parts[-2]} (priority 0)"
+    conditions_target = os.path.join(os.path.dirname(target), "_conditions.txt")
+
+    inputs = _plan_row_inputs(kind, entry, new_priority) if manifest else None
+    if manifest and manifest.is_current(target, inputs):
+        if kind == "custom":
+            manifest.keep(conditions_target)
+        log_lines.append(log_line)
+        return
+
+    dst_file = os.path.join(out_dir, target)
+    payload = None
+    priority = new_priority
+    if kind == "oar":
+        try:
+            with open(entry[0], "rb") as f:
+                raw = f.read()
+            data = json_codec().loads(raw)  # битый JSON — ошибка чтения, в вывод не копируется
+        except Exception as e:
+            raise RuntimeError(f"Read error {entry[0]}: {e}")
+        # быстрый путь: исходные байты с заменённым числом
+        payload = patch_priority(raw, old_priority, new_priority)
+        if payload is None:
+            if "priority" in data:
+                data["priority"] = new_priority
+            else:
+                log_line = priority = None
+    else:
+        # DAR Legacy: только user.json, .hkx OAR прочитает из оригинального мода через VFS
+        data = {
+            "priority": new_priority,
+            "disabled": False,
+            "replacementAnimations": []
+        }
+        conditions_src = os.path.join(entry[0], "_conditions.txt")
+        if kind == "custom" and os.path.exists(conditions_src):
+            try:
+                writer.copy_file(conditions_src, os.path.join(out_dir, conditions_target))
+                data["conditions"] = [{"condition": "loaded_from_conditions_txt"}]
+                if manifest:
+                    manifest.record(conditions_target, inputs, None)
+            except Exception as e:
+                log_lines.append(f"  Warning: Failed to copy _conditions.txt: {e}")
+
+    if payload is None:
+        payload = json_codec().dumps(data)
+    digest = content_digest(payload) if manifest else None
+    if not (manifest and manifest.content_unchanged(target, inputs, digest)):
+        if journal:
+            journal.file_planned(dst_file, priority)
+
+        def done():
+            if journal:
+                journal.file_written(dst_file)
+            if manifest:
+                manifest.record(target, inputs, digest)
+        writer.write_bytes(dst_file, payload, done)
+    if log_line:
+        log_lines.append(log_line)
+
+def _write_plan_rows(out_dir, mod_display_name, rows, log_lines, journal=None, manifest=None, writer=None):
+    own_writer = writer is None
+    if own_writer:
+        writer = OutputWriter()
+    try:
+        for row in rows:
+            _write_plan_row(out_dir, mod_display_name, row, log_lines, journal, manifest, writer)
+        writer.flush()
+    finally:
+        if own_writer:
+            writer.close()
+
+def copy_dar_legacy_mod(mod_folder_path, out_dir, mod_display_name, start_priority, log_lines, scan=None, journal=None,
+                        manifest=None, writer=None):
     """
     Создаёт структуру папок и user.json для DAR Legacy мода с новыми приоритетами.
     Не копирует .hkx файлы — OAR прочитает их из оригинального мода через VFS.
@@ -265,159 +1445,671 @@ def copy_dar_legacy_mod(mod_folder_path, out_dir, mod_display_name, start_priori
     Для ActorBase:
     - Создаёт структуру <Mod.esp>/<FormID>/
     - Создаёт user.json с priority = 0
+
+    scan: готовый ModScan этого мода (иначе мод сканируется заново).
+    journal: RunJournal — каждый user.json отмечается в журнале до и после записи.
+    manifest: OutputManifest — неизменившиеся файлы не переписываются.
+    writer: OutputWriter (иначе файлы пишутся последовательно); записи дописываются до возврата.
     """
-    priority_counter = start_priority
-    dar_base = os.path.join(mod_folder_path, "meshes", "actors")
-    
-    if not os.path.isdir(dar_base):
-        return priority_counter
-    
-    for root, dirs, files in os.walk(dar_base):
-        if DAR_KEYWORD.lower() not in root.replace("/", "\\").lower():
-            continue
-        
-        # Проверка на _CustomConditions
-        if "_CustomConditions" in root:
-            current_folder = os.path.basename(root)
-            
-            if current_folder.lower() == "_customconditions":
-                continue
-            
-            try:
-                old_priority = int(current_folder)
-                if old_priority == 0:
-                    continue
-            except ValueError:
-                continue
-            
-            # Создаём структуру с НОВЫМ приоритетом
-            new_priority_path = os.path.join(out_dir, "meshes", "actors", "character", "animations", 
-                                            DAR_KEYWORD, "_CustomConditions", str(priority_counter))
-            os.makedirs(new_priority_path, exist_ok=True)
-            
-            # Создаём user.json с новым приоритетом
-            user_json = {
-                "priority": priority_counter,
-                "disabled": False,
-                "replacementAnimations": []  # OAR возьмёт анимации из оригинального мода
-            }
-            
-            # Проверяем _conditions.txt в оригинале
-            conditions_src = os.path.join(root, "_conditions.txt")
-            if os.path.exists(conditions_src):
-                # Копируем _conditions.txt в новую папку
-                conditions_dst = os.path.join(new_priority_path, "_conditions.txt")
-                try:
-                    shutil.copy2(conditions_src, conditions_dst)
-                    user_json["conditions"] = [{"condition": "loaded_from_conditions_txt"}]
-                except Exception as e:
-                    log_lines.append(f"  Warning: Failed to copy _conditions.txt: {e}")
-            
-            user_json_path = os.path.join(new_priority_path, "user.json")
-            with open(user_json_path, "w", encoding=LOG_ENCODING) as f:
-                json.dump(user_json, f, ensure_ascii=False, indent=2)
-            
-            log_lines.append(f"[{mod_display_name}] DAR Custom: priority {old_priority} → {priority_counter}")
-            priority_counter += 1
-        
-        else:
-            # ActorBase структура
-            rel_path = os.path.relpath(root, dar_base)
-            parts = rel_path.replace("/", "\\").split("\\")
-            
-            if len(parts) >= 5 and parts[2].lower() == DAR_KEYWORD.lower():
-                mod_name = parts[-2]
-                form_id = parts[-1]
-                
-                if len(form_id) == 8 and all(c in "0123456789ABCDEFabcdef" for c in form_id):
-                    # Копируем структуру (priority = 0 для ActorBase)
-                    target_path = os.path.join(out_dir, "meshes", "actors", "character", "animations",
-                                              DAR_KEYWORD, mod_name, form_id)
-                    os.makedirs(target_path, exist_ok=True)
-                    
-                    # Создаём user.json с priority = 0
-                    user_json = {
-                        "priority": 0,
-                        "disabled": False,
-                        "replacementAnimations": []
-                    }
-                    
-                    user_json_path = os.path.join(target_path, "user.json")
-                    with open(user_json_path, "w", encoding=LOG_ENCODING) as f:
-                        json.dump(user_json, f, ensure_ascii=False, indent=2)
-                    
-                    log_lines.append(f"[{mod_display_name}] DAR ActorBase: {mod_name}\\{form_id} (priority 0)")
-    
+    if scan is None:
+        scan = scan_mod(mod_folder_path, parse_json=False)
+    rows, priority_counter = _plan_dar(scan, start_priority)
+    _write_plan_rows(out_dir, mod_display_name, rows, log_lines, journal, manifest, writer)
     return priority_counter
 
-def copy_jsons_from_mod(mod_folder_path, out_dir, mod_display_name, priority_counter, log_lines, include_dar_legacy=False):
+def copy_jsons_from_mod(mod_folder_path, out_dir, mod_display_name, priority_counter, log_lines, include_dar_legacy=False, scan=None,
+                        journal=None, manifest=None, writer=None):
     """
-    Копирование json'ов и назначение новых priority.
+    Копирование json'ов и назначение новых priority (по плану plan_mod).
     Возвращает обновлённый priority_counter.
 
     Если include_dar_legacy=True, также обрабатывает DAR Legacy моды.
+    scan: готовый ModScan этого мода (иначе мод сканируется заново).
+    journal: RunJournal — каждый файл отмечается в журнале до и после записи.
+    manifest: OutputManifest — неизменившиеся файлы не переписываются.
+    writer: OutputWriter (иначе файлы пишутся последовательно); записи дописываются до возврата.
     """
-    # Обрабатываем OAR записи
-    jsons = collect_jsons(mod_folder_path)
-    for src_file, rel_path, file, data, old_pri in jsons:
-        target_root = os.path.join(out_dir, rel_path)
-        os.makedirs(target_root, exist_ok=True)
-        dst_file = os.path.join(target_root, file)
-        if "priority" in data:
-            data["priority"] = priority_counter
-            log_lines.append(f"[{mod_display_name}] {src_file} : {old_pri} → {priority_counter}")
-            priority_counter += 1
-        with open(dst_file, "w", encoding=LOG_ENCODING) as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+    if scan is None:
+        scan = scan_mod(mod_folder_path)
+    if scan.error:
+        raise RuntimeError(scan.error)
+
+    rows = plan_mod(scan, priority_counter, include_dar_legacy)
+    _write_plan_rows(out_dir, mod_display_name, rows, log_lines, journal, manifest, writer)
+    return priority_counter + sum(1 for row in rows if row[0] != "actor")
+
+# ==== Priority conflict analysis ====
 
-    # Обрабатываем DAR Legacy записи если включено
+def _distinct_priorities(scan, include_dar_legacy, ordered_only=False):
+    """
+    Отсортированные уникальные целые приоритеты мода.
+    ordered_only=True — без DAR ActorBase (их priority = 0 не участвует в порядке).
+    """
+    values = set(scan.oar_entries.int_priorities())
     if include_dar_legacy:
-        priority_counter = copy_dar_legacy_mod(mod_folder_path, out_dir, mod_display_name, priority_counter, log_lines)
+        dar = scan.dar_entries
+        if ordered_only:
+            values.update(pri for pri, entry_type in zip(dar.priorities, dar.types) if entry_type != "actor")
+        else:
+            values.update(dar.priorities)
+    return sorted(values)
 
-    return priority_counter
+def analyze_priority_conflicts(mods_dir, selected_mods_ordered, include_dar_legacy=False, mod_scans=None, workers=1):
+    """
+    Поиск конфликтов приоритетов между модами (folders) в порядке загрузки.
+
+    Для каждого мода держится только отсортированный список уникальных приоритетов
+    (память ~ числу различных приоритетов, а не файлов):
+    - дубли — слиянием отсортированных списков (heapq.merge), O(n log k);
+    - пересечения диапазонов [min, max] — sweep line по началам интервалов, O(k log k + пар).
+
+    Возвращает (duplicate_conflicts, range_conflicts):
+      duplicate_conflicts: [(priority, [folders])] по возрастанию приоритета
+      range_conflicts: [(kind, earlier_folder, later_folder, earlier_range, later_range)]
+        kind: "contained" — диапазон одного мода целиком внутри диапазона другого,
+              "overlap"   — диапазоны частично перекрываются (приоритеты перемешаны).
+    """
+    import heapq
 
-def find_priority_conflicts(mods_dir, selected_mods_ordered, include_dar_legacy=False):
+    mod_scans = dict(mod_scans or {})
+    missing = [mod for mod in selected_mods_ordered
+               if mod not in mod_scans and os.path.exists(os.path.join(mods_dir, mod))]
+    if missing:
+        mod_scans.update(scan_mods(mods_dir, missing, workers=workers))
+
+    per_mod = []    # (load_index, folder, sorted distinct priorities)
+    intervals = []  # (lo, hi, load_index)
+    for load_index, mod in enumerate(selected_mods_ordered):
+        scan = mod_scans.get(mod)
+        if scan is None:
+            continue
+        per_mod.append((load_index, mod, _distinct_priorities(scan, include_dar_legacy)))
+        ordered = _distinct_priorities(scan, include_dar_legacy, ordered_only=True)
+        if ordered:
+            intervals.append((ordered[0], ordered[-1], load_index))
+
+    # дубли: k-путевое слияние
+    duplicate_conflicts = []
+    streams = [[(pri, load_index) for pri in values] for load_index, _, values in per_mod]
+    current, owners = None, []
+    for pri, load_index in heapq.merge(*streams):
+        if pri != current:
+            if len(owners) > 1:
+                duplicate_conflicts.append((current, sorted(selected_mods_ordered[i] for i in owners)))
+            current, owners = pri, []
+        owners.append(load_index)
+    if len(owners) > 1:
+        duplicate_conflicts.append((current, sorted(selected_mods_ordered[i] for i in owners)))
+
+    # пересечения диапазонов: sweep line, активные интервалы в куче по правому концу
+    pairs = []  # (earlier_index, later_index, kind, earlier_range, later_range)
+    active = []  # (hi, lo, load_index)
+    for lo, hi, load_index in sorted(intervals):
+        while active and active[0][0] < lo:
+            heapq.heappop(active)
+        for other_hi, other_lo, other_index in active:
+            a, b = sorted(((other_lo, other_hi, other_index), (lo, hi, load_index)), key=lambda x: x[2])
+            contained = (a[0] <= b[0] and b[1] <= a[1]) or (b[0] <= a[0] and a[1] <= b[1])
+            pairs.append((a[2], b[2], "contained" if contained else "overlap", (a[0], a[1]), (b[0], b[1])))
+        heapq.heappush(active, (hi, lo, load_index))
+
+    pairs.sort()
+    range_conflicts = [(kind, selected_mods_ordered[i], selected_mods_ordered[j], range_i, range_j)
+                       for i, j, kind, range_i, range_j in pairs]
+    return duplicate_conflicts, range_conflicts
+
+def find_priority_conflicts(mods_dir, selected_mods_ordered, include_dar_legacy=False, mod_scans=None, workers=1):
     """
     Проверка на дубли приоритетов между выбранными модами (folders).
     selected_mods_ordered: список имён папок (в mods/staging).
     include_dar_legacy: если True, также проверяет DAR Legacy моды.
+    mod_scans: dict folder -> ModScan с уже готовыми результатами сканирования
+               (недостающие папки сканируются, параллельно при workers > 1).
     Возвращает duplicate_conflicts: [(priority, [folders])]
     """
-    all_entries = []
-    for load_index, mod in enumerate(selected_mods_ordered):
-        mod_path = os.path.join(mods_dir, mod)
-        if not os.path.exists(mod_path):
+    duplicate_conflicts, _ = analyze_priority_conflicts(mods_dir, selected_mods_ordered, include_dar_legacy,
+                                                        mod_scans=mod_scans, workers=workers)
+    return duplicate_conflicts
+
+def format_range_conflict(conflict):
+    """Строка лога для записи range_conflicts."""
+    kind, earlier, later, earlier_range, later_range = conflict
+    a = f"'{earlier}' ({earlier_range[0]} - {earlier_range[1]})"
+    b = f"'{later}' ({later_range[0]} - {later_range[1]})"
+    if kind == "contained":
+        inner, outer = (b, a) if earlier_range[0] <= later_range[0] and later_range[1] <= earlier_range[1] else (a, b)
+        return f" - {inner} lies inside {outer}"
+    return f" - {a} and {b} interleave"
+
+def conflict_folder_sets(duplicate_conflicts, range_conflicts):
+    """(папки с дублями, папки только с пересечением диапазонов) — для подсветки строк таблицы."""
+    conflict_folders = set()
+    for _, mods in duplicate_conflicts:
+        conflict_folders.update(mods)
+    overlap_folders = set()
+    for _, earlier, later, _, _ in range_conflicts:
+        overlap_folders.update((earlier, later))
+    return conflict_folders, overlap_folders - conflict_folders
+
+def scan_signature(scan):
+    """То, от чего зависят конфликты и диапазоны мода: файлы и их приоритеты."""
+    return (scan.oar_entries.signature(), scan.dar_entries.signature(), scan.error)
+
+class ConflictCache:
+    """
+    Результаты анализа для текущего поколения сканов: дубли, пересечения,
+    множества папок для подсветки и used ranges. Пересчитываются только после
+    invalidate() (Load / Check / изменение на диске) или смены Include DAR,
+    поэтому сортировка таблицы не трогает ни диск, ни анализ.
+    """
+
+    def __init__(self):
+        self.generation = 0
+        self._key = None
+        self._result = None
+
+    def invalidate(self):
+        self.generation += 1
+
+    def get(self, mods_dir, sources_ordered, source_to_folder, mod_scans, include_dar):
+        """Возвращает (duplicates, range_conflicts, conflict_folders, overlap_folders, used_ranges)."""
+        key = (self.generation, bool(include_dar))
+        if key != self._key:
+            folders = [source_to_folder[s] for s in sources_ordered if source_to_folder.get(s)]
+            duplicates, range_conflicts = analyze_priority_conflicts(
+                mods_dir, folders, include_dar_legacy=include_dar, mod_scans=mod_scans)
+            conflict_folders, overlap_folders = conflict_folder_sets(duplicates, range_conflicts)
+            used_ranges = build_used_ranges(sources_ordered, source_to_folder, mod_scans, include_dar)
+            self._result = (duplicates, range_conflicts, conflict_folders, overlap_folders, used_ranges)
+            self._key = key
+        return self._result
+
+    def refresh_scan(self, mod_scans, folder, scan):
+        """Подменяет скан мода; при изменении содержимого сбрасывает кэш."""
+        old = mod_scans.get(folder)
+        mod_scans[folder] = scan
+        if old is None or scan_signature(old) != scan_signature(scan):
+            self.invalidate()
+
+# ==== Gap-aware priority allocator ====
+
+PRIORITY_MAX = 2147483647  # OAR хранит priority как знаковое 32-битное число
+
+class PriorityAllocator:
+    """
+    Индекс свободных приоритетов в [low, high] вокруг занятых значений.
+
+    Свободные промежутки между занятыми приоритетами — слоты (отсортированы по началу);
+    в каждом слоте список свободных кусков, над слотами — дерево отрезков
+    с максимальной длиной куска. "Первый свободный блок размера N не ниже X" —
+    bisect по слотам + спуск по дереву, O(log слотов).
+    """
+
+    def __init__(self, occupied=(), low=1, high=PRIORITY_MAX):
+        self.low = low
+        self.high = high
+        gaps = []
+        cursor = low
+        for value in sorted(set(occupied)):
+            if value < cursor:
+                continue
+            if value > high:
+                break
+            if value > cursor:
+                gaps.append([cursor, value - 1])
+            cursor = value + 1
+        if cursor <= high:
+            gaps.append([cursor, high])
+
+        self._starts = [g[0] for g in gaps]
+        self._free = [[g] for g in gaps]  # слот -> отсортированные свободные куски [lo, hi]
+        self._size = 1
+        while self._size < max(len(gaps), 1):
+            self._size *= 2
+        self._tree = [0] * (2 * self._size)
+        for i in range(len(gaps)):
+            self._update(i)
+
+    def _update(self, slot):
+        node = self._size + slot
+        self._tree[node] = max((hi - lo + 1 for lo, hi in self._free[slot]), default=0)
+        node //= 2
+        while node:
+            self._tree[node] = max(self._tree[2 * node], self._tree[2 * node + 1])
+            node //= 2
+
+    def _find_slot(self, first, size):
+        """Самый левый слот >= first, где есть кусок длиной >= size, или -1."""
+        def walk(node, lo, hi):
+            if hi < first or self._tree[node] < size:
+                return -1
+            if lo == hi:
+                return lo
+            mid = (lo + hi) // 2
+            found = walk(2 * node, lo, mid)
+            return found if found != -1 else walk(2 * node + 1, mid + 1, hi)
+        return walk(1, 0, self._size - 1)
+
+    def first_free_block(self, size, above=None):
+        """Начало первого свободного блока из size подряд идущих приоритетов, не ниже above; None — места нет."""
+        import bisect
+        above = self.low if above is None else max(above, self.low)
+        slot = bisect.bisect_right(self._starts, above) - 1
+        if slot >= 0:
+            for lo, hi in self._free[slot]:
+                lo = max(lo, above)
+                if hi - lo + 1 >= size:
+                    return lo
+        found = self._find_slot(slot + 1, size)
+        if found == -1:
+            return None
+        for lo, hi in self._free[found]:
+            if hi - lo + 1 >= size:
+                return lo
+        return None
+
+    def reserve(self, start, size):
+        """Помечает [start, start + size - 1] занятым (блок должен быть свободен)."""
+        import bisect
+        end = start + size - 1
+        slot = bisect.bisect_right(self._starts, start) - 1
+        pieces = self._free[slot] if slot >= 0 else []
+        for i, (lo, hi) in enumerate(pieces):
+            if lo <= start and end <= hi:
+                rest = [p for p in ([lo, start - 1], [end + 1, hi]) if p[0] <= p[1]]
+                pieces[i:i + 1] = rest
+                self._update(slot)
+                return
+        raise ValueError(f"Priorities {start} - {end} are not free")
+
+    def allocate(self, size, above=None):
+        """Находит и резервирует блок; возвращает его начало. ValueError, если места нет."""
+        start = self.first_free_block(size, above)
+        if start is None:
+            raise ValueError(f"No free block of {size} priorities above {above}")
+        self.reserve(start, size)
+        return start
+
+def mod_block_size(scan, include_dar_legacy=False):
+    """Сколько новых приоритетов получит мод при Run (OAR-записи + DAR CustomConditions)."""
+    size = len(scan.oar_entries)
+    if include_dar_legacy:
+        size += scan.dar_entries.count("custom")
+    return size
+
+def allocate_mod_blocks(selected_folders, mod_scans, start_priority, include_dar_legacy=False,
+                        reserved_folders=(), pinned_folders=()):
+    """
+    Назначает каждому выбранному моду непрерывный блок приоритетов, по порядку
+    (блок следующего мода всегда выше блока предыдущего).
+
+    reserved_folders: моды, чьи текущие приоритеты заняты (не выбраны, но остаются как есть).
+    pinned_folders: закреплённые моды — никогда не перенумеровываются, их приоритеты заняты.
+    Возвращает dict folder -> начало блока (None для закреплённых).
+    ValueError, если блок не помещается.
+    """
+    pinned = set(pinned_folders)
+    occupied = set()
+    for folder in set(reserved_folders) | pinned:
+        scan = mod_scans.get(folder)
+        if scan is not None:
+            occupied.update(_distinct_priorities(scan, include_dar_legacy))
+
+    allocator = PriorityAllocator(occupied, low=start_priority)
+    blocks = {}
+    above = start_priority
+    for folder in selected_folders:
+        if folder in pinned:
+            blocks[folder] = None
             continue
-        
-        # OAR записи
-        try:
-            jsons = collect_jsons(mod_path)
-        except RuntimeError:
-            jsons = []
-        
-        for _, _, file_name, data, priority in jsons:
+        size = mod_block_size(mod_scans[folder], include_dar_legacy)
+        if not size:
+            blocks[folder] = above
+            continue
+        start = allocator.allocate(size, above)
+        blocks[folder] = start
+        above = start + size
+    return blocks
+
+def write_mod_blocks(mods_dir, jobs, mod_scans, blocks, out_root, log_lines, include_dar_legacy=False,
+                     progress=None, cancel=None, journal=None, manifest=None, writer=None):
+    """
+    Run: пишет конфиги модов jobs [(имя для лога, folder)] в out_root, каждый — со своего блока
+    (см. allocate_mod_blocks); закреплённые моды (блок None) пропускаются.
+    cancel: threading.Event — проверяется между модами, начатый мод всегда дописывается.
+    journal: RunJournal — моды, уже записанные прерванным Run с теми же входными данными,
+             пропускаются; остальные записываются в журнал.
+    manifest: OutputManifest — неизменившиеся файлы не переписываются.
+    writer: OutputWriter — общий на весь Run (пул потоков записи, созданные папки).
+    Возвращает (записанные folders, dict folder -> текст ошибки).
+    """
+    written, errors = [], {}
+    total = len(jobs)
+    for done, (name, folder) in enumerate(jobs, 1):
+        if cancel is not None and cancel.is_set():
+            break
+        if blocks[folder] is not None and journal and folder in journal.completed:
+            log_lines.append(f"[{name}] already written by the interrupted Run, skipped")
+            if manifest:
+                manifest.keep_mod(folder)
+            written.append(folder)
+        elif blocks[folder] is not None:
             try:
-                pri_val = int(priority)
-            except Exception:
-                pri_val = priority
-            all_entries.append((mod, file_name, pri_val, load_index, "OAR"))
-        
-        # DAR Legacy записи
-        if include_dar_legacy:
-            dar_entries = collect_dar_legacy_entries(mod_path)
-            for _, rel_path, filename, data, priority, condition, hkx_count, entry_type in dar_entries:
-                try:
-                    pri_val = int(priority)
-                except Exception:
-                    pri_val = priority
-                all_entries.append((mod, filename, pri_val, load_index, f"DAR-{entry_type}"))
+                if journal:
+                    journal.begin_mod(folder, blocks[folder])
+                if manifest:
+                    manifest.mod = folder
+                copy_jsons_from_mod(os.path.join(mods_dir, folder), out_root, name, blocks[folder], log_lines,
+                                    include_dar_legacy=include_dar_legacy, scan=mod_scans[folder], journal=journal,
+                                    manifest=manifest, writer=writer)
+                if journal:
+                    journal.end_mod(folder)
+                written.append(folder)
+            except (RuntimeError, OSError) as e:
+                errors[folder] = str(e)
+        if progress:
+            progress(done, total, name, mod_scans.get(folder))
+    return written, errors
+
+# ==== Run journal ====
+
+JOURNAL_FILENAME = "prioarity_journal.jsonl"
+JOURNAL_VERSION = 1
+
+def run_inputs_hash(jobs, mod_scans, blocks, include_dar_legacy=False):
+    """Хэш всего, что определяет вывод Run: моды по порядку, их блоки и содержимое (файлы и приоритеты)."""
+    import hashlib
+    plan = [JOURNAL_VERSION, bool(include_dar_legacy)]
+    for name, folder in jobs:
+        scan = mod_scans.get(folder)
+        plan.append([name, folder, blocks.get(folder), scan_signature(scan) if scan is not None else None])
+    return hashlib.sha1(json.dumps(plan, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+class RunJournal:
+    """
+    Журнал Run (write-ahead) в выходной папке: по записи JSONL на каждый
+    запланированный и на каждый записанный файл с его новым приоритетом,
+    плюс начало/конец каждого мода.
+
+        {"type": "run", "inputs": <hash>, "started": ...}
+        {"type": "mod", "mod": folder, "start": N}
+        {"type": "plan", "mod": folder, "file": <путь от out_root>, "priority": N}
+        {"type": "done", "mod": folder, "file": ...}
+        {"type": "mod_done", "mod": folder}
+        {"type": "finished"}
+
+    Если в папке лежит незавершённый журнал с тем же хэшем входных данных,
+    completed — моды, записанные полностью (их можно пропустить), и журнал дописывается.
+    Иначе журнал начинается заново.
+    """
 
-    pri_map = {}
-    for mod, file_name, pri, _, _ in all_entries:
-        pri_map.setdefault(pri, set()).add(mod)
+    def __init__(self, out_root, inputs_hash):
+        self.out_root = out_root
+        self.path = os.path.join(out_root, JOURNAL_FILENAME)
+        self.completed, valid_size = self._read_completed(self.path, inputs_hash)
+        self._mod = None
+        if self.completed is None:
+            self.completed = set()
+            self._file = open(self.path, "w", encoding="utf-8")
+            self._record({"type": "run", "inputs": inputs_hash, "version": JOURNAL_VERSION,
+                          "started": datetime.now().isoformat(timespec="seconds")})
+        else:
+            # оборванная при сбое последняя строка отрезается
+            with open(self.path, "r+b") as f:
+                f.truncate(valid_size)
+            self._file = open(self.path, "a", encoding="utf-8")
+            self._record({"type": "resume", "started": datetime.now().isoformat(timespec="seconds"),
+                          "completed": len(self.completed)})
+
+    @staticmethod
+    def _read_completed(path, inputs_hash):
+        """
+        (моды, завершённые незаконченным Run с тем же inputs_hash, размер целых записей в байтах);
+        (None, 0) — продолжать нечего.
+        """
+        try:
+            with open(path, "rb") as f:
+                line = f.readline()
+                header = json.loads(line) if line.endswith(b"\n") else None
+                if not header or header.get("type") != "run" or header.get("inputs") != inputs_hash:
+                    return None, 0
+                completed = set()
+                valid_size = len(line)
+                for line in f:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError
+                        record = json.loads(line)
+                    except ValueError:
+                        break  # оборванная последняя строка
+                    valid_size += len(line)
+                    if record.get("type") == "mod_done":
+                        completed.add(record["mod"])
+                    elif record.get("type") == "finished":
+                        return None, 0
+                return completed, valid_size
+        except (OSError, ValueError):
+            return None, 0
+
+    def _record(self, record, sync=False):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        if sync:
+            os.fsync(self._file.fileno())
+
+    def begin_mod(self, folder, start):
+        self._mod = folder
+        self._record({"type": "mod", "mod": folder, "start": start})
+
+    def file_planned(self, path, priority):
+        self._record({"type": "plan", "mod": self._mod, "file": os.path.relpath(path, self.out_root),
+                      "priority": priority})
+
+    def file_written(self, path):
+        self._record({"type": "done", "mod": self._mod, "file": os.path.relpath(path, self.out_root)})
+
+    def end_mod(self, folder):
+        self._record({"type": "mod_done", "mod": folder}, sync=True)
+        self.completed.add(folder)
+        self._mod = None
+
+    def close(self, finished=False):
+        """finished=True — Run дошёл до конца без ошибок: следующий Run начнёт с нуля."""
+        if self._file is None:
+            return
+        if finished:
+            self._record({"type": "finished"}, sync=True)
+        self._file.close()
+        self._file = None
+
+# ==== Output manifest ====
+
+MANIFEST_FILENAME = "prioarity_manifest.json"
+MANIFEST_VERSION = 2
+
+def content_digest(payload):
+    import hashlib
+    return hashlib.sha1(payload).hexdigest()
+
+class OutputManifest:
+    """
+    Манифест выходной папки: для каждого файла, записанного Run, —
+    [ключ входных данных, sha1 содержимого, folder мода].
+
+    Файл не переписывается, если ключ входных данных совпал (источник не читается)
+    или совпало получившееся содержимое. Исключение — путь, который этот Run уже записал
+    (патч-мод перекрывает конфиг более раннего мода): он пишется всегда, иначе более поздний
+    мод, совпавший с прошлым манифестом, оставил бы в файле содержимое раннего. Файлы из прошлого манифеста,
+    которые текущий Run не производит (моды сняты с выбора, сменились приоритеты),
+    удаляются в remove_stale().
+    """
 
-    duplicate_conflicts = [(pri, sorted(list(folders))) for pri, folders in pri_map.items() if len(folders) > 1]
-    return duplicate_conflicts
+    def __init__(self, out_root):
+        self.out_root = out_root
+        self.path = os.path.join(out_root, MANIFEST_FILENAME)
+        self.previous = self._load(self.path)
+        self.current = {}
+        self.mod = None  # folder мода, который сейчас пишется
+        self.written = self.skipped = self.removed = 0
+
+    @staticmethod
+    def _load(path):
+        try:
+            data = read_json_file(path)
+            if data.get("version") == MANIFEST_VERSION:
+                return data.get("files", {})
+        except (OSError, ValueError, AttributeError):
+            pass
+        return {}
+
+    def _exists(self, rel):
+        return os.path.isfile(os.path.join(self.out_root, rel))
+
+    def is_current(self, rel, inputs):
+        """Входные данные файла не изменились и файл на месте — переписывать не нужно."""
+        if rel in self.current:
+            return False  # путь уже записан этим Run другим модом
+        old = self.previous.get(rel)
+        if old and old[0] == inputs and self._exists(rel):
+            self.current[rel] = [inputs, old[1], self.mod]
+            self.skipped += 1
+            return True
+        return False
+
+    def content_unchanged(self, rel, inputs, digest):
+        """Содержимое совпало с уже записанным — переписывать не нужно."""
+        if rel in self.current:
+            return False
+        old = self.previous.get(rel)
+        if old and digest and old[1] == digest and self._exists(rel):
+            self.current[rel] = [inputs, digest, self.mod]
+            self.skipped += 1
+            return True
+        return False
+
+    def record(self, rel, inputs, digest):
+        self.current[rel] = [inputs, digest, self.mod]
+        self.written += 1
+
+    def keep(self, rel):
+        old = self.previous.get(rel)
+        if old and rel not in self.current and self._exists(rel):
+            self.current[rel] = old
+            self.skipped += 1
+
+    def keep_mod(self, folder):
+        """Оставить все файлы мода из прошлого манифеста как есть (мод не переписывается)."""
+        for rel, entry in self.previous.items():
+            if entry[2] == folder and rel not in self.current:
+                self.current[rel] = entry
+                self.skipped += 1
+
+    def remove_stale(self):
+        """Удаляет файлы прошлого манифеста, которые этот Run не произвёл, и опустевшие папки."""
+        root = os.path.abspath(self.out_root)
+        for rel in self.previous:
+            if rel in self.current:
+                continue
+            path = os.path.join(root, rel)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            except OSError:
+                self.current[rel] = self.previous[rel]  # не удалось — остаётся в манифесте
+                continue
+            self.removed += 1
+            parent = os.path.dirname(path)
+            while parent != root and parent.startswith(root):
+                try:
+                    os.rmdir(parent)
+                except OSError:
+                    break
+                parent = os.path.dirname(parent)
+
+    def save(self, complete=True):
+        """complete=False (Run прерван) — файлы прошлого манифеста сохраняются вместе с новыми."""
+        files = dict(self.current) if complete else dict(self.previous, **self.current)
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(json_codec().dumps({"version": MANIFEST_VERSION, "files": files}, compact=True))
+        os.replace(tmp, self.path)
+
+    def summary(self):
+        return f"{self.written} written, {self.skipped} unchanged, {self.removed} removed"
+
+def run_output(mods_dir, jobs, mod_scans, blocks, out_root, log_lines, include_dar_legacy=False,
+               progress=None, cancel=None, workers=1):
+    """
+    Запись Run целиком: журнал (возобновление прерванного Run), манифест
+    (неизменившиеся файлы не переписываются, устаревшие удаляются после полного Run)
+    и write_mod_blocks через OutputWriter с workers потоками записи.
+    Возвращает (записанные folders, ошибки, OutputManifest).
+    """
+    journal = RunJournal(out_root, run_inputs_hash(jobs, mod_scans, blocks, include_dar_legacy))
+    if journal.completed:
+        log_lines.append(f"Resuming the interrupted Run: {len(journal.completed)} mods already written")
+    manifest = OutputManifest(out_root)
+    writer = OutputWriter(workers)
+    finished = False
+    try:
+        written, errors = write_mod_blocks(mods_dir, jobs, mod_scans, blocks, out_root, log_lines,
+                                           include_dar_legacy=include_dar_legacy, progress=progress,
+                                           cancel=cancel, journal=journal, manifest=manifest, writer=writer)
+        finished = not errors and not (cancel is not None and cancel.is_set())
+        if finished:
+            manifest.remove_stale()
+    finally:
+        writer.close()
+        journal.close(finished)
+        manifest.save(complete=finished)
+    log_lines.append(f"Output files: {manifest.summary()}")
+    return written, errors, manifest
+
+def run_archive(mods_dir, jobs, mod_scans, blocks, archive_path, log_lines, include_dar_legacy=False,
+                progress=None, cancel=None, meta_ini=False):
+    """
+    Run сразу в .zip-архив (ZipOutputWriter), готовый для установки в MO2;
+    meta_ini — добавить в архив meta.ini. Журнал и манифест не ведутся: архив каждый раз
+    собирается целиком и при отмене не заменяется.
+    Возвращает (записанные folders, ошибки, ZipOutputWriter).
+    """
+    writer = ZipOutputWriter(archive_path)
+    committed = False
+    try:
+        if meta_ini:
+            writer.write_bytes("meta.ini", META_INI.encode(LOG_ENCODING))
+        written, errors = write_mod_blocks(mods_dir, jobs, mod_scans, blocks, "", log_lines,
+                                           include_dar_legacy=include_dar_legacy, progress=progress,
+                                           cancel=cancel, writer=writer)
+        writer.flush()
+        committed = not (cancel is not None and cancel.is_set())
+    finally:
+        writer.close(commit=committed)
+    if committed:
+        log_lines.append(f"Archive: {writer.count} files written to {archive_path}")
+    return written, errors, writer
+
+# ==== MO2 helpers ====
+
+def resolve_mo2_mods_dir(profile_path, mods_dir_override=None):
+    """Папка mods: явно указанная (если существует) или <profile>/../../mods."""
+    mods_dir_override = (mods_dir_override or "").strip()
+    if mods_dir_override and os.path.isdir(mods_dir_override):
+        return mods_dir_override
+    return os.path.abspath(os.path.join(profile_path, "..", "..", "mods"))
+
+def read_mo2_active_mods(profile_path):
+    """
+    Читает modlist.txt профиля MO2.
+    Возвращает включённые моды в порядке загрузки (первый в списке MO2 загружается последним).
+    """
+    modlist_file = os.path.join(profile_path, "modlist.txt")
+    with open(modlist_file, encoding="utf-8") as f:
+        lines = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    active_mods = [line[1:].strip() for line in lines if line.startswith("+")]
+    active_mods.reverse()  # first in list = loaded last
+    return active_mods
 
 # ==== Vortex helpers ====
 
@@ -451,9 +2143,173 @@ def recursive_find_key(obj, key_name):
                 return res
     return None
 
-def load_vortex_deployment(deployment_file):
-    if not os.path.exists(deployment_file):
-        raise FileNotFoundError(f"Deployment file not found: {deployment_file}")
+# ключи записи деплоя, которые нужны дальше; остальное (target, time, merged...) отбрасывается при чтении
+DEPLOY_REL_KEYS = ("relPath", "relpath")
+DEPLOY_SOURCE_KEYS = ("source", "Source", "mod")
+DEPLOY_PATH_KEYS = ("stagingPath", "targetPath")
+
+def is_animation_rel_path(rel):
+    rel = str(rel).lower()
+    return OAR_KEYWORD.lower() in rel or DAR_KEYWORD.lower() in rel
+
+def compact_deploy_entry(entry):
+    """Запись деплоя -> {"relPath", "source"}, если она про OAR/DAR и у неё есть источник, иначе None."""
+    rel = entry.get("relPath") or entry.get("relpath") or ""
+    src = entry.get("source") or entry.get("Source") or entry.get("mod") or None
+    if not src or not is_animation_rel_path(rel):
+        return None
+    return {"relPath": rel, "source": src}
+
+# ключи верхнего уровня, чей список берётся как записи, если recursive_find_entries ничего не нашёл
+DEPLOY_FALLBACK_KEYS = ("files", "entries")
+
+class _DeploymentStream:
+    """
+    Потоковый разбор vortex.deployment.msgpack через msgpack.Unpacker.
+    Контейнеры обходятся по заголовкам, в памяти остаются только нужные записи (relPath/source
+    для OAR/DAR) и stagingPath/targetPath. Семантика поиска — как у _load_vortex_deployment_full:
+    первый список, чей первый элемент — запись (recursive_find_entries), иначе список
+    files / entries верхнего уровня; первое значение ключа пути в порядке обхода (recursive_find_key).
+    Тип значения определяется пробой read_map_header / read_array_header: только C-расширение
+    msgpack при неудаче не сдвигает поток, поэтому с msgpack.fallback класс не используется
+    (см. load_vortex_deployment).
+    """
+
+    def __init__(self, unpacker):
+        self.unpacker = unpacker
+        self.entries = None  # первый найденный список записей (уже отфильтрованный)
+        self.total = 0       # всего записей в этом списке
+        self.fallback = {}   # files / entries верхнего уровня -> (записи, число словарей)
+        self._open = []      # own / nested открытых словарей: ключ, уже найденный выше, глубже не нужен
+
+    def result(self):
+        """(записи, всего записей): как в полном загрузчике, с запасным files / entries."""
+        if self.entries is not None:
+            return self.entries, self.total
+        for key in DEPLOY_FALLBACK_KEYS:
+            if key in self.fallback:
+                return self.fallback[key]
+        return [], 0
+
+    def value(self, top=False, fallback=None):
+        """
+        Читает одно значение, возвращает найденные в нём {ключ пути: значение}.
+        top — корень файла; fallback — ключ верхнего уровня, если значение может стать запасным списком.
+        """
+        try:
+            size = self.unpacker.read_map_header()
+        except ValueError:
+            pass
+        else:
+            found = self._map(size, top=top)
+            if fallback:
+                self.fallback[fallback] = ([], 0)  # как data.get("files"): не список — записей нет
+            return found
+        try:
+            size = self.unpacker.read_array_header()
+        except ValueError:
+            pass
+        else:
+            return self._array(size, fallback)
+        if fallback:
+            if self.unpacker.unpack() is not None:  # None — как отсутствующий ключ
+                self.fallback[fallback] = ([], 0)
+        else:
+            self.unpacker.skip()
+        return {}
+
+    def _map(self, size, row=None, top=False):
+        own, nested = {}, {}
+        self._open += (own, nested)
+        for _ in range(size):
+            key = self.unpacker.unpack()
+            if not isinstance(key, (str, bytes)):
+                raise ValueError(f"{type(key).__name__} is not allowed for map key")  # как strict_map_key
+            if key in DEPLOY_PATH_KEYS:
+                own[key] = self._whole(self.unpacker.unpack(), nested)
+            elif row is not None and key in DEPLOY_REL_KEYS + DEPLOY_SOURCE_KEYS:
+                row[key] = self._whole(self.unpacker.unpack(), nested)
+            else:
+                fallback = key if top and key in DEPLOY_FALLBACK_KEYS else None
+                for k, v in self.value(fallback=fallback).items():
+                    nested.setdefault(k, v)
+        del self._open[-2:]
+        # как recursive_find_key: ключ самого словаря важнее найденного глубже
+        found = {k: own[k] if k in own else nested.get(k) for k in DEPLOY_PATH_KEYS}
+        return {k: v for k, v in found.items() if v is not None}
+
+    def _whole(self, value, nested):
+        """Значение, прочитанное целиком: ключи путей и список записей ищутся и внутри него."""
+        if isinstance(value, (dict, list)):
+            for k, v in recursive_find_keys(value, DEPLOY_PATH_KEYS).items():
+                nested.setdefault(k, v)
+            if self.entries is None:
+                entries = recursive_find_entries(value)
+                if entries:
+                    entries = [e for e in entries if isinstance(e, dict)]
+                    self.entries = [c for c in map(compact_deploy_entry, entries) if c]
+                    self.total = len(entries)
+        return value
+
+    def _array(self, size, fallback=None):
+        found = {}
+        kept = []
+        rows = 0  # элементов-словарей
+        first = self.entries is None  # до первого элемента: списки внутри него идут позже этого
+        for i in range(size):
+            row = {}
+            try:
+                size_row = self.unpacker.read_map_header()
+            except ValueError:
+                sub = self.value()
+                row = None
+            else:
+                sub = self._map(size_row, row)
+                rows += 1
+            for k, v in sub.items():
+                found.setdefault(k, v)
+            if row:
+                entry = compact_deploy_entry(row)
+                if entry:
+                    kept.append(entry)
+            if i == 0 and row and any(k in row for k in DEPLOY_REL_KEYS):
+                # список записей деплоя: остальные элементы — плоские словари, читаем их целиком
+                if first:
+                    self.entries = None
+                self._entries_tail(size - 1, kept, rows, found)
+                return found
+        if fallback:
+            self.fallback[fallback] = (kept, rows)
+        return found
+
+    def _entries_tail(self, count, kept, rows, found):
+        """Остальные элементы списка записей; ключи путей, ещё не найденные, ищутся и в них."""
+        missing = [k for k in DEPLOY_PATH_KEYS
+                   if k not in found and not any(k in d for d in self._open)]
+        keep = self.entries is None
+        if not keep and not missing:
+            for _ in range(count):
+                self.unpacker.skip()
+            return
+        unpack = self.unpacker.unpack
+        for _ in range(count):
+            entry = unpack()
+            if missing:
+                for k, v in recursive_find_keys(entry, missing).items():
+                    found.setdefault(k, v)
+                missing = [k for k in missing if k not in found]
+            if keep and isinstance(entry, dict):
+                rows += 1
+                entry = compact_deploy_entry(entry)
+                if entry:
+                    kept.append(entry)
+        if keep:
+            self.entries = kept
+            self.total = rows
+
+def _load_vortex_deployment_full(deployment_file):
+    """Прежний способ: распаковать файл целиком. Используется, если потоковый разбор не удался."""
+    import msgpack
     with open(deployment_file, "rb") as f:
         data = msgpack.unpack(f, raw=False)
     entries = recursive_find_entries(data)
@@ -461,52 +2317,185 @@ def load_vortex_deployment(deployment_file):
         entries = data.get("files") if isinstance(data, dict) else None
     if entries is None:
         entries = data.get("entries") if isinstance(data, dict) else None
-    staging_path = recursive_find_key(data, "stagingPath")
-    target_path = recursive_find_key(data, "targetPath")
-    return {"stagingPath": staging_path, "targetPath": target_path, "entries": entries or []}
+    entries = [e for e in entries if isinstance(e, dict)] if isinstance(entries, list) else []
+    compact = [c for c in map(compact_deploy_entry, entries) if c]
+    return {"stagingPath": recursive_find_key(data, "stagingPath"),
+            "targetPath": recursive_find_key(data, "targetPath"),
+            "entries": compact, "entry_count": len(entries)}
+
+def recursive_find_keys(obj, keys):
+    """{ключ: recursive_find_key(obj, ключ)} для найденных ключей."""
+    found = {}
+    for key in keys:
+        value = recursive_find_key(obj, key)
+        if value is not None:
+            found[key] = value
+    return found
 
-def extract_ordered_sources_from_entries(entries):
-    seen = []
+def load_vortex_deployment(deployment_file):
+    """
+    Читает vortex.deployment.msgpack потоково. Возвращает {"stagingPath", "targetPath",
+    "entries": [{"relPath", "source"}, ...] только для OAR/DAR, "entry_count": всего записей}.
+    """
+    if not os.path.exists(deployment_file):
+        raise FileNotFoundError(f"Deployment file not found: {deployment_file}")
+    import msgpack
+    if msgpack.Unpacker.__module__ == "msgpack.fallback":
+        # чистый Python: read_*_header съедает заголовок и при неудаче, потоковый разбор невозможен
+        return _load_vortex_deployment_full(deployment_file)
+    try:
+        with open(deployment_file, "rb") as f:
+            stream = _DeploymentStream(msgpack.Unpacker(f, raw=False))
+            found = stream.value(top=True)
+    except (ValueError, msgpack.UnpackException):
+        return _load_vortex_deployment_full(deployment_file)
+    entries, total = stream.result()
+    return {"stagingPath": found.get("stagingPath"), "targetPath": found.get("targetPath"),
+            "entries": entries, "entry_count": total}
+
+class DeploySource:
+    """
+    Что деплой знает об одном источнике Vortex (см. summarize_deployment_sources):
+    oar_paths / dar_paths — число путей с OAR / DAR в relPath;
+    paths — сами relPath (для scan_mod_from_deployment).
+    """
+    __slots__ = ("oar_paths", "dar_paths", "paths")
+
+    def __init__(self):
+        self.oar_paths = 0
+        self.dar_paths = 0
+        self.paths = []
+
+def summarize_deployment_sources(entries):
+    """
+    Один проход по записям деплоя: {source: DeploySource} в порядке первого появления источника,
+    только для записей с OAR/DAR в relPath.
+    """
+    oar_kw = OAR_KEYWORD.lower()
+    dar_kw = DAR_KEYWORD.lower()
+    summary = {}
     for e in entries:
-        rel = e.get("relPath") or e.get("relpath") or ""
         src = e.get("source") or e.get("Source") or e.get("mod") or None
         if not src:
             continue
-        if OAR_KEYWORD.lower() in str(rel).lower() or DAR_KEYWORD.lower() in str(rel).lower():
-            if src not in seen:
-                seen.append(src)
-    return seen
+        rel = str(e.get("relPath") or e.get("relpath") or "")
+        rel_lower = rel.lower()
+        is_oar = oar_kw in rel_lower
+        if not is_oar and dar_kw not in rel_lower:
+            continue
+        info = summary.get(src)
+        if info is None:
+            info = summary[src] = DeploySource()
+        if is_oar:
+            info.oar_paths += 1
+        else:
+            info.dar_paths += 1
+        info.paths.append(rel)
+    return summary
+
+def extract_ordered_sources_from_entries(entries):
+    return list(summarize_deployment_sources(entries))
+
+_NAME_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+def name_tokens(s):
+    """Слова имени в нижнем регистре: 'Mod-Name_v2' -> ['mod', 'name', 'v2']."""
+    return _NAME_TOKEN_RE.findall((s or "").lower())
 
 def canonicalize_name(s):
-    s = s or ""
-    s = s.lower()
-    s = re.sub(r"[^a-z0-9]+", " ", s)
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
+    return " ".join(name_tokens(s))
+
+class StagingResolver:
+    """
+    Сопоставление источников Vortex с папками staging. Папка читается и канонизируется один раз,
+    дальше каждый поиск — обращение к индексам:
+      exact  — каноническое имя -> папки;
+      token  — слово -> номера папок (имя источника целиком входит в имя папки);
+      prefix — отсортированные канонические имена (bisect) для базового имени до первого '-'.
+    Порядок проверок как у прежнего find_mod_folder_by_source: точное совпадение, вхождение
+    в одну или другую сторону (теперь по целым словам), затем базовое имя. Если на шаге подходит
+    несколько папок, берётся самая близкая по длине имени, а варианты сохраняются в self.ambiguous.
+    """
+
+    def __init__(self, staging_mods_dir):
+        self.staging_mods_dir = staging_mods_dir
+        self.folders = []
+        self.ambiguous = {}  # source -> [подходящие папки], выбрана первая
+        self.error = None
+        try:
+            with os.scandir(staging_mods_dir) as it:
+                self.folders = [e.name for e in it if e.is_dir()]
+        except OSError as e:
+            self.error = e
+        self._canon = [canonicalize_name(f) for f in self.folders]
+        self._exact = {}
+        self._token = {}
+        for i, can in enumerate(self._canon):
+            self._exact.setdefault(can, []).append(i)
+            for token in set(can.split()):
+                self._token.setdefault(token, set()).add(i)
+        self._prefix = sorted((can, i) for i, can in enumerate(self._canon))
+
+    def _containing(self, can):
+        """Папки, в имени которых can встречается целыми словами."""
+        tokens = can.split()
+        postings = [self._token.get(t, ()) for t in tokens]
+        if not tokens or not all(postings):
+            return []
+        ids = set.intersection(*postings)
+        padded = f" {can} "
+        return [i for i in ids if padded in f" {self._canon[i]} "]
+
+    def _contained(self, can):
+        """Папки, имя которых целыми словами входит в can."""
+        tokens = can.split()
+        ids = []
+        for start in range(len(tokens)):
+            for end in range(start + 1, len(tokens) + 1):
+                ids.extend(self._exact.get(" ".join(tokens[start:end]), ()))
+        return ids
+
+    def _with_prefix(self, can):
+        ids = []
+        pos = bisect.bisect_left(self._prefix, (can, -1))
+        while pos < len(self._prefix) and self._prefix[pos][0].startswith(can):
+            name, i = self._prefix[pos]
+            if len(name) == len(can) or name[len(can)] == " ":
+                ids.append(i)
+            pos += 1
+        return ids
+
+    def _pick(self, source_name, can, ids):
+        ids = sorted(set(ids), key=lambda i: (abs(len(self._canon[i]) - len(can)), i))
+        if len(ids) > 1:
+            self.ambiguous[source_name] = [self.folders[i] for i in ids]
+        return self.folders[ids[0]]
+
+    def resolve(self, source_name):
+        """Папка staging для источника или None."""
+        src_can = canonicalize_name(source_name)
+        if not src_can:
+            return None
+        ids = self._exact.get(src_can)
+        if ids:
+            return self._pick(source_name, src_can, ids)
+        ids = self._containing(src_can) + self._contained(src_can)
+        if ids:
+            return self._pick(source_name, src_can, ids)
+        base_can = canonicalize_name(source_name.split("-")[0])
+        if base_can:
+            ids = self._with_prefix(base_can) or self._containing(base_can)
+            if ids:
+                return self._pick(source_name, base_can, ids)
+        return None
 
 def find_mod_folder_by_source(staging_mods_dir, source_name):
     if not os.path.isdir(staging_mods_dir):
         return None
-    try:
-        candidates = [d for d in os.listdir(staging_mods_dir) if os.path.isdir(os.path.join(staging_mods_dir, d))]
-    except Exception:
-        return None
-    src_can = canonicalize_name(source_name)
-    for c in candidates:
-        if canonicalize_name(c) == src_can:
-            return c
-    for c in candidates:
-        cand_can = canonicalize_name(c)
-        if cand_can in src_can or src_can in cand_can:
-            return c
-    src_base = source_name.split("-")[0].strip()
-    src_base_can = canonicalize_name(src_base)
-    for c in candidates:
-        if src_base_can and src_base_can in canonicalize_name(c):
-            return c
-    return None
+    return StagingResolver(staging_mods_dir).resolve(source_name)
 
 def manual_order_window(selected_sources):
+    import FreeSimpleGUI as sg
     layout = [
         [sg.Text("Manual reordering of selected mods:", font=("Default", 12, "bold"))],
         [
@@ -561,27 +2550,303 @@ def manual_order_window(selected_sources):
 
 # ==== UI helpers ====
 
+# ==== Log sink ====
+
+LOG_VIEW_LINES = 2000  # строк в окне лога; более старые вытесняются (в файл пишется всё)
+LOG_FLUSH_MS = 200     # как часто обновлять виджет LOG во время фоновой задачи
+
+class LogSink:
+    """
+    Лог окна: кольцевой буфер последних строк для виджета LOG, который
+    перерисовывается пачкой в flush(), и потоковая запись в файл лога, пока он открыт.
+    append() совместим с list.append — sink передаётся вместо log_lines,
+    в том числе из рабочего потока.
+    """
+
+    def __init__(self, window=None, max_lines=LOG_VIEW_LINES):
+        from collections import deque
+        self.window = window
+        self.lines = deque(maxlen=max_lines)
+        self.file_lines = 0
+        self.file_path = None
+        self._file = None
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def append(self, line):
+        with self._lock:
+            self.lines.append(line)
+            self._dirty = True
+            if self._file is not None:
+                self._file.write(("\n" if self.file_lines else "") + line)
+                self.file_lines += 1
+
+    def extend(self, lines):
+        for line in lines:
+            self.append(line)
+
+    def clear(self):
+        with self._lock:
+            self.lines.clear()
+            self._dirty = True
+
+    def set_lines(self, lines):
+        """Заменяет содержимое окна лога (в открытый файл строки дописываются)."""
+        self.clear()
+        self.extend(lines)
+
+    def open_file(self, path):
+        """Дальнейшие строки пишутся в path по мере поступления. OSError — если файл не открыть."""
+        self.close_file()
+        f = open(path, "w", encoding=LOG_ENCODING)
+        with self._lock:
+            self._file = f
+            self.file_path = path
+            self.file_lines = 0
+
+    def close_file(self):
+        """Закрывает файл лога; возвращает его путь (None, если файл не был открыт)."""
+        with self._lock:
+            f, path = self._file, self.file_path
+            self._file = self.file_path = None
+        if f is not None:
+            f.close()
+        return path
+
+    def flush(self):
+        """Перерисовывает LOG, если с прошлого раза были новые строки (только из потока GUI)."""
+        if not self._dirty or self.window is None:
+            return
+        with self._lock:
+            text = "\n".join(self.lines)
+            self._dirty = False
+        try:
+            self.window["LOG"].update(text)
+        except Exception:
+            pass
+
+_LOG_SINKS = None
+
+def log_sink(window):
+    """LogSink окна (создаётся при первом обращении)."""
+    global _LOG_SINKS
+    if _LOG_SINKS is None:
+        import weakref
+        _LOG_SINKS = weakref.WeakKeyDictionary()
+    sink = _LOG_SINKS.get(window)
+    if sink is None:
+        sink = _LOG_SINKS[window] = LogSink(window)
+    return sink
+
 def append_log(window, text):
     print(text)
+    log_sink(window).append(text)
+
+# ==== Background tasks ====
+
+TASK_PROGRESS_EVENT = "-TASK-PROGRESS-"
+TASK_DONE_EVENT = "-TASK-DONE-"
+BUSY_DISABLED_KEYS = ("Load mods", "Check", "Run", "Save session", "Load session", "Pin / Unpin", "Export plan")
+
+def _files_of(result):
+    """Сколько файлов просмотрено для результата задачи: ModScan или (folder, ModScan)."""
+    if isinstance(result, tuple):
+        result = result[-1]
+    return getattr(result, "file_count", 0)
+
+class TaskProgress:
+    """
+    progress-callback для run_parallel/scan_mods в рабочем потоке.
+    Считает файлы в секунду и ETA и отправляет их в окно через write_event_value
+    не чаще INTERVAL секунд (последний шаг — всегда).
+    """
+
+    INTERVAL = 0.1
+
+    def __init__(self, window):
+        import time
+        self._clock = time.perf_counter
+        self.window = window
+        self.started = self._clock()
+        self.files = 0
+        self._last_post = 0.0
+
+    def __call__(self, done, total, item, result=None):
+        self.files += _files_of(result)
+        now = self._clock()
+        if done < total and now - self._last_post < self.INTERVAL:
+            return
+        self._last_post = now
+        elapsed = max(now - self.started, 1e-6)
+        rate = self.files / elapsed
+        eta = elapsed / done * (total - done) if done else None
+        self.window.write_event_value(TASK_PROGRESS_EVENT, (done, total, self.files, rate, eta, str(item)))
+
+def set_busy(window, busy, title=""):
+    """Блокирует кнопки на время фоновой задачи и показывает/сбрасывает прогресс."""
+    for key in BUSY_DISABLED_KEYS:
+        try:
+            window[key].update(disabled=busy)
+        except Exception:
+            pass
     try:
-        cur = window["LOG"].get() if window and window["LOG"] else ""
+        window["Cancel"].update(disabled=not busy)
+        window["PROGRESS"].update(current_count=0, max=1)
+        window["PROGRESS_TEXT"].update(f"{title}..." if busy else "")
     except Exception:
-        cur = ""
-    new = (cur + ("\n" if cur else "") + text).strip()
+        pass
+
+def show_progress(window, title, done, total, files, rate, eta, item):
+    eta_text = f"{eta:.0f} s" if eta is not None else "?"
     try:
-        window["LOG"].update(new)
+        window["PROGRESS"].update(current_count=done, max=max(total, 1))
+        window["PROGRESS_TEXT"].update(
+            f"{title}: {done}/{total} mods, {files} files, {rate:.0f} files/s, ETA {eta_text} — {item}")
     except Exception:
         pass
 
-def build_table_values_list(mod_sources_ordered, used_ranges, source_to_type=None):
+def run_task(window, title, func):
+    """
+    Выполняет func(progress, cancel) в рабочем потоке, пока окно обрабатывает
+    события прогресса и кнопку Cancel (окно не зависает).
+    cancel — threading.Event; func проверяет его между модами.
+    Возвращает (status, value):
+      ("done", результат) | ("cancelled", None) | ("error", исключение) | ("closed", None) — окно закрыто.
+    """
+    import FreeSimpleGUI as sg
+    cancel = threading.Event()
+    progress = TaskProgress(window)
+
+    def worker():
+        try:
+            outcome = ("done", func(progress, cancel))
+        except OperationCancelled:
+            outcome = ("cancelled", None)
+        except Exception as e:
+            outcome = ("error", e)
+        try:
+            window.write_event_value(TASK_DONE_EVENT, outcome)
+        except Exception:
+            pass
+
+    set_busy(window, True, title)
+    thread = threading.Thread(target=worker, name=f"PriOARity: {title}", daemon=True)
+    thread.start()
+    sink = log_sink(window)
+    while True:
+        event, values = window.read(timeout=LOG_FLUSH_MS)
+        sink.flush()
+        if event == sg.WIN_CLOSED:
+            # дождаться границы мода: задача может писать в индекс/выходную папку
+            cancel.set()
+            thread.join()
+            return "closed", None
+        if event == "Cancel":
+            cancel.set()
+            try:
+                window["PROGRESS_TEXT"].update(f"{title}: cancelling after the current mod...")
+            except Exception:
+                pass
+        elif event == TASK_PROGRESS_EVENT:
+            show_progress(window, title, *values[event])
+        elif event == TASK_DONE_EVENT:
+            thread.join()
+            set_busy(window, False)
+            return values[event]
+
+def refresh_provisional_scans(window, mods_dir, mod_scans, folders, conflicts, index=None, workers=1):
+    """
+    Сканы folders, построенные по деплою (from_manifest, см. scan_mod_from_deployment),
+    заменяет сканами с диска в фоновой задаче — перед экспортом плана.
+    Возвращает статус run_task ("done" и без задачи, если заменять нечего).
+    """
+    provisional = [f for f in folders if mod_scans.get(f) is not None and mod_scans[f].from_manifest]
+    if not provisional:
+        return "done"
+    status, scans = run_task(window, "Scanning mods", lambda progress, cancel: scan_mods(
+        mods_dir, provisional, index=index, workers=workers, progress=progress, cancel=cancel))
+    if status == "done":
+        for folder, scan in scans.items():
+            conflicts.refresh_scan(mod_scans, folder, scan)
+    else:
+        report_task(window, "Scanning mods", status, scans)
+    return status
+
+def show_run_plan(window, values, jobs, mod_scans, reserved_folders=(), pinned_folders=()):
+    """
+    Пересчитывает план Run для jobs [(имя, folder)] по уже готовым сканам (диск не трогается)
+    и показывает сводку в PLAN. Возвращает план build_run_plan или None.
+    """
+    def show(lines):
+        try:
+            window["PLAN"].update("\n".join(lines))
+        except Exception:
+            pass
+
+    try:
+        start_priority = int(values.get("START_PRIORITY", 1))
+        if start_priority < 1:
+            raise ValueError
+    except Exception:
+        show(["Plan: start priority must be integer (>=1)."])
+        return None
+    include_dar = values.get("INCLUDE_DAR", True)
+    jobs = [(name, folder) for name, folder in jobs if folder in mod_scans]
+    if not jobs:
+        show([])
+        return None
+    try:
+        blocks = allocate_mod_blocks([folder for _, folder in jobs], mod_scans, start_priority,
+                                     include_dar_legacy=include_dar, reserved_folders=reserved_folders,
+                                     pinned_folders=pinned_folders)
+    except ValueError as e:
+        show([f"Plan: cannot place priorities: {e}"])
+        return None
+    plan = build_run_plan(jobs, mod_scans, blocks, include_dar)
+    lines = plan_summary_lines(plan)
+    pinned = [name for name, folder in jobs if blocks[folder] is None]
+    if pinned:
+        lines.append(f"  pinned, kept as is: {', '.join(pinned)}")
+    if any(mod_scans[f].from_manifest for f in list(blocks) + list(reserved_folders) if f in mod_scans):
+        lines.append("  preliminary: based on the Vortex deployment; Export plan and Run rescan the mods from disk")
+    show(lines)
+    return plan
+
+def export_plan_dialog(window, plan):
+    """Спрашивает путь и сохраняет план в CSV."""
+    import FreeSimpleGUI as sg
+    if not plan:
+        sg.popup_error("Nothing to export: select mods in the table first.")
+        return
+    path = sg.popup_get_file("Export plan", save_as=True, file_types=(("CSV", "*.csv"),), default_extension=".csv")
+    if not path:
+        return
+    try:
+        export_plan_csv(path, plan)
+        append_log(window, f"Plan exported ({len(plan)} files): {path}")
+    except OSError as e:
+        sg.popup_error(f"Failed to export plan:\n{e}")
+
+def report_task(window, title, status, value):
+    """Пишет в лог итог неудачной задачи. True — задача завершилась успешно."""
+    if status == "cancelled":
+        append_log(window, f"{title} cancelled.")
+    elif status == "error":
+        append_log(window, f"{title} failed: {value}")
+    return status == "done"
+
+def build_table_values_list(mod_sources_ordered, used_ranges, source_to_type=None, pinned_sources=None):
     """
     Строит список значений для таблицы модов.
     source_to_type: dict source -> mod_type string
+    pinned_sources: закреплённые моды (помечаются в колонке Type)
     """
     out = []
     for idx, src in enumerate(mod_sources_ordered, 1):
         rng = used_ranges.get(src, "")
         mod_type = source_to_type.get(src, "") if source_to_type else ""
+        if pinned_sources and src in pinned_sources:
+            mod_type = f"{mod_type} (pinned)".strip()
         out.append([idx, src, mod_type, rng])
     return out
 
@@ -591,24 +2856,26 @@ def safe_table_indices(value):
     return [i for i in value if isinstance(i, int)]
 
 def save_session(file_path, data):
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    with open(file_path, "wb") as f:
+        f.write(json_codec().dumps(data))
 
 def load_session(file_path):
-    with open(file_path, encoding="utf-8") as f:
-        return json.load(f)
+    return read_json_file(file_path)
 
 def update_mods_table(window, display_sources, used_ranges, sort_key=None, reverse=False, 
-                      source_to_folder=None, conflict_folders=None, source_to_type=None):
+                      source_to_folder=None, conflict_folders=None, source_to_type=None, overlap_folders=None,
+                      pinned_sources=None):
     """
     display_sources: list of source strings in the order to show
     used_ranges: dict source->range string
     sort_key: column index to sort by (0,1,2,3)
     conflict_folders: set of folder names (to color rows)
+    overlap_folders: set of folder names with overlapping ranges only (colored orange)
     source_to_folder: mapping source->folder for checking conflicts
     source_to_type: mapping source->mod_type string
+    pinned_sources: set of pinned sources (marked in the Type column)
     """
-    rows = build_table_values_list(display_sources, used_ranges, source_to_type)
+    rows = build_table_values_list(display_sources, used_ranges, source_to_type, pinned_sources)
     if sort_key is not None:
         def key_func(row):
             val = row[sort_key]
@@ -630,12 +2897,14 @@ def update_mods_table(window, display_sources, used_ranges, sort_key=None, rever
         rows.sort(key=key_func, reverse=reverse)
 
     row_colors = []
-    if conflict_folders and source_to_folder:
+    if (conflict_folders or overlap_folders) and source_to_folder:
         for i, r in enumerate(rows):
             src = r[1]
             mapped = source_to_folder.get(src)
-            if mapped and mapped in conflict_folders:
+            if mapped and conflict_folders and mapped in conflict_folders:
                 row_colors.append((i, "white", "red"))
+            elif mapped and overlap_folders and mapped in overlap_folders:
+                row_colors.append((i, "black", "orange"))
 
     try:
         window["MODS_TABLE"].update(values=rows, row_colors=row_colors)
@@ -644,13 +2913,18 @@ def update_mods_table(window, display_sources, used_ranges, sort_key=None, rever
 
 # ==== Mode chooser UI ====
 
-def choose_mode():
+def build_mode_window():
+    import FreeSimpleGUI as sg
     layout = [
         [sg.Text("Select working mode:")],
         [sg.Button("MO2", size=(10,1)), sg.Button("Vortex", size=(10,1))],
         [sg.Button("Exit")]
     ]
-    win = sg.Window("PriOARity — Mode selection", layout, modal=True, element_justification="center")
+    return sg.Window("PriOARity — Mode selection", layout, modal=True, element_justification="center")
+
+def choose_mode():
+    import FreeSimpleGUI as sg
+    win = build_mode_window()
     mode = None
     while True:
         event, _ = win.read()
@@ -665,10 +2939,12 @@ def choose_mode():
 # ==== Per-mode UIs (simple separate windows) ====
 
 def build_common_ui(title="PriOARity", input_label="Profile / Deployment", folder_mode=False):
+    import FreeSimpleGUI as sg
     sg.change_look_and_feel("DarkGrey9")
     INPUT_WIDTH = 80
     LIST_HEIGHT = 20
     LOG_HEIGHT = 16
+    PLAN_HEIGHT = 5
 
     browse_btn = sg.FolderBrowse("Browse") if folder_mode else sg.FileBrowse("Browse")
     layout = [
@@ -687,7 +2963,20 @@ def build_common_ui(title="PriOARity", input_label="Profile / Deployment", folde
             [sg.Button("Load mods", size=(12,1)), sg.Button("Check", size=(10,1)), sg.Button("Run", button_color=("white","green"), size=(10,1)),
              sg.Checkbox("Manual order", key="MANUAL_ORDER", default=False)],
             [sg.Checkbox("Include DAR Legacy mods", key="INCLUDE_DAR", default=True, 
-                        tooltip="Scan for DAR Legacy animation structures and include them in priority assignment")],
+                        tooltip="Scan for DAR Legacy animation structures and include them in priority assignment"),
+             sg.Text("Mods drive:"),
+             sg.Combo(list(SCAN_WORKERS), default_value=DEFAULT_DISK_TYPE, key="DISK_TYPE", readonly=True, size=(6,1),
+                      tooltip="Drive type of the mods folder: SSD scans with more threads, HDD with fewer")],
+            [sg.Checkbox("Keep other mods' priorities (fill free gaps)", key="FILL_GAPS", default=False,
+                         tooltip="Mods not selected for Run keep their priorities; selected mods are placed into free gaps"),
+             sg.Button("Pin / Unpin", size=(12,1),
+                       tooltip="Pinned mods keep their current priorities: Run never renumbers them")],
+            [sg.Checkbox(f"Write {ARCHIVE_NAME} instead of a folder", key="ZIP_OUTPUT", default=False,
+                         tooltip="Run writes a ready-to-install archive into the output path"),
+             sg.Checkbox("with meta.ini", key="ZIP_META_INI", default=False)],
+            [sg.ProgressBar(1, orientation="h", size=(40, 12), key="PROGRESS"),
+             sg.Button("Cancel", size=(10,1), disabled=True),
+             sg.Text("", key="PROGRESS_TEXT", size=(90,1))],
         ], pad=(8,8), expand_x=True)],
 
         [sg.Frame("Detected animation mods (table):", [
@@ -704,6 +2993,10 @@ def build_common_ui(title="PriOARity", input_label="Profile / Deployment", folde
                       row_colors=[]
                       )]
         ], pad=(8,8), expand_x=True, expand_y=True)],
+        [sg.Frame("Run plan (selected mods)", [
+            [sg.Multiline(size=(INPUT_WIDTH, PLAN_HEIGHT), key="PLAN", disabled=True, expand_x=True),
+             sg.Button("Export plan", size=(12,1), tooltip="Save the full plan (every file, old and new priority) as CSV")]
+        ], pad=(8,8), expand_x=True)],
         [sg.Frame("Execution log", [
             [sg.Multiline(size=(INPUT_WIDTH, LOG_HEIGHT), key="LOG", autoscroll=True, disabled=True, expand_x=True)]
         ], pad=(8,8), expand_x=True)]
@@ -713,35 +3006,49 @@ def build_common_ui(title="PriOARity", input_label="Profile / Deployment", folde
 # ==== Run MO2 mode ====
 
 def run_mo2_mode():
+    import FreeSimpleGUI as sg
     window = build_common_ui(title="PriOARity — MO2 mode", input_label="MO2 Profile folder", folder_mode=True)
+    index = open_animation_index()
 
     mods_dir = None
     mod_sources_ordered = []
     display_sources = []
     source_to_folder = {}
     source_to_type = {}  # source -> mod_type string
+    mod_scans = {}  # folder -> ModScan (результат последнего Load/Check)
+    pinned_sources = set()  # закреплённые моды: Run не меняет их приоритеты
+    conflicts = ConflictCache()  # анализ конфликтов для текущих mod_scans
+    conflict_folders, overlap_folders = set(), set()
     used_ranges = {}
     sort_column = None
     sort_reverse = False
 
     while True:
+        log_sink(window).flush()
         event, values = window.read()
         if event in (sg.WIN_CLOSED, "Exit"):
             window.close()
+            if index:
+                index.close()
             return "exit"
         if event == "Back":
             window.close()
+            if index:
+                index.close()
             return "back"
 
         mode = "MO2"
 
         if event == "Load mods":
-            window["LOG"].update("")
+            log_sink(window).clear()
             used_ranges = {}
             sort_column = None
             sort_reverse = False
             source_to_folder = {}
             source_to_type = {}
+            mod_scans = {}
+            conflict_folders, overlap_folders = set(), set()
+            conflicts.invalidate()
             mod_sources_ordered = []
             display_sources = []
 
@@ -755,33 +3062,32 @@ def run_mo2_mode():
                 sg.popup_error("modlist.txt not found in profile folder.")
                 continue
 
-            mods_dir_input = (values.get("MODS_DIR") or "").strip()
-            if mods_dir_input and os.path.isdir(mods_dir_input):
-                mods_dir = mods_dir_input
-            else:
-                mods_dir = os.path.abspath(os.path.join(profile_path, "..", "..", "mods"))
+            mods_dir = resolve_mo2_mods_dir(profile_path, values.get("MODS_DIR"))
             if not os.path.isdir(mods_dir):
                 sg.popup_error(f"Mods folder not found: {mods_dir}")
                 continue
 
             # read active mods
-            with open(modlist_file, encoding="utf-8") as f:
-                lines = [line.strip() for line in f if line.strip() and not line.startswith("#")]
-            active_mods = [line[1:].strip() for line in lines if line.startswith("+")]
-            active_mods.reverse()  # first in list = loaded last
+            active_mods = read_mo2_active_mods(profile_path)
 
             # filter animation mods (OAR + DAR Legacy)
             include_dar = values.get("INCLUDE_DAR", True)
-            for m in active_mods:
-                mod_path = os.path.join(mods_dir, m)
-                mod_type = detect_mod_type(mod_path)
-                if mod_type:
+            workers = scan_worker_count(values.get("DISK_TYPE"))
+            status, scans = run_task(window, "Loading mods", lambda progress, cancel: scan_mods(
+                mods_dir, active_mods, index=index, workers=workers, progress=progress, cancel=cancel))
+            if status == "closed":
+                break
+            if not report_task(window, "Loading mods", status, scans):
+                continue
+            for m, scan in scans.items():
+                if scan.mod_type:
+                    mod_scans[m] = scan
                     mod_sources_ordered.append(m)
                     source_to_folder[m] = m
-                    source_to_type[m] = mod_type
+                    source_to_type[m] = scan.mod_type
 
             display_sources = list(mod_sources_ordered)
-            table_values = build_table_values_list(display_sources, used_ranges, source_to_type)
+            table_values = build_table_values_list(display_sources, used_ranges, source_to_type, pinned_sources)
             try:
                 window["MODS_TABLE"].update(values=table_values, row_colors=[])
             except Exception:
@@ -810,49 +3116,27 @@ def run_mo2_mode():
             if not all_folders:
                 append_log(window, "No mapped folders found, cannot scan.")
                 continue
-            try:
-                duplicate_conflicts = find_priority_conflicts(mods_dir, all_folders, include_dar_legacy=include_dar)
-            except Exception as e:
-                append_log(window, f"Error scanning priorities: {e}")
+            workers = scan_worker_count(values.get("DISK_TYPE"))
+            # один свежий проход по каждому моду, дальше всё считается из mod_scans
+            status, new_scans = run_task(window, "Checking mods", lambda progress, cancel: scan_mods(
+                mods_dir, all_folders, index=index, workers=workers, progress=progress, cancel=cancel))
+            if status == "closed":
+                break
+            if status == "error":
+                append_log(window, f"Error scanning priorities: {new_scans}")
                 continue
-            
-            # compute used ranges per source
-            used_ranges = {}
-            for src in mod_sources_ordered:
-                folder = source_to_folder.get(src)
-                if not folder:
-                    continue
-                mod_path = os.path.join(mods_dir, folder)
-                
-                # OAR priorities
-                try:
-                    jsons = collect_jsons(mod_path)
-                    pri_values = [int(j[4]) for j in jsons if "priority" in j[3]]
-                    if pri_values:
-                        used_ranges[src] = f"{min(pri_values)} - {max(pri_values)}"
-                except RuntimeError:
-                    pass
-                
-                # DAR Legacy priorities
-                if include_dar:
-                    dar_entries = collect_dar_legacy_entries(mod_path)
-                    dar_pri_values = [int(e[4]) for e in dar_entries]
-                    if dar_pri_values:
-                        dar_range = f"{min(dar_pri_values)} - {max(dar_pri_values)}"
-                        if src in used_ranges:
-                            used_ranges[src] = f"{used_ranges[src]} + {dar_range} (DAR)"
-                        else:
-                            used_ranges[src] = f"{dar_range} (DAR)"
-            
-            # conflict folders
-            conflict_folders = set()
-            for pri, mods in duplicate_conflicts:
-                conflict_folders.update(mods)
+            if not report_task(window, "Check", status, new_scans):
+                continue
+            mod_scans = new_scans
+            conflicts.invalidate()
+            (duplicate_conflicts, range_conflicts, conflict_folders, overlap_folders,
+             used_ranges) = conflicts.get(mods_dir, mod_sources_ordered, source_to_folder, mod_scans, include_dar)
 
             # update table
             update_mods_table(window, display_sources, used_ranges, sort_key=sort_column, 
                             reverse=sort_reverse, source_to_folder=source_to_folder, 
-                            conflict_folders=conflict_folders, source_to_type=source_to_type)
+                            conflict_folders=conflict_folders, source_to_type=source_to_type,
+                            overlap_folders=overlap_folders, pinned_sources=pinned_sources)
 
             # log
             log_lines = []
@@ -862,7 +3146,10 @@ def run_mo2_mode():
                     log_lines.append(f" - Priority {pri}: mods: {', '.join(mods)}")
             else:
                 log_lines.append("✅ No duplicate priorities detected.")
-            window["LOG"].update("\n".join(log_lines))
+            if range_conflicts:
+                log_lines.append("⚠️ Overlapping priority ranges (load order may not be respected):")
+                log_lines.extend(format_range_conflict(c) for c in range_conflicts)
+            log_sink(window).set_lines(log_lines)
             append_log(window, "Check finished.")
         
         if event == "Save session":
@@ -887,9 +3174,14 @@ def run_mo2_mode():
                 "start_priority": values.get("START_PRIORITY"),
                 "manual_order": values.get("MANUAL_ORDER", False),
                 "include_dar": values.get("INCLUDE_DAR", True),
+                "disk_type": values.get("DISK_TYPE", DEFAULT_DISK_TYPE),
                 "mod_sources_ordered": mod_sources_ordered,
                 "display_sources": display_sources,
                 "source_to_type": source_to_type,  # сохраняем типы модов
+                "fill_gaps": values.get("FILL_GAPS", False),
+                "zip_output": values.get("ZIP_OUTPUT", False),
+                "zip_meta_ini": values.get("ZIP_META_INI", False),
+                "pinned_sources": sorted(pinned_sources),
                 "selected_sources": [
                     display_sources[i]
                     for i in selected_indices
@@ -927,39 +3219,27 @@ def run_mo2_mode():
             window["START_PRIORITY"].update(session.get("start_priority", "1"))
             window["MANUAL_ORDER"].update(session.get("manual_order", False))
             window["INCLUDE_DAR"].update(session.get("include_dar", True))
+            window["DISK_TYPE"].update(session.get("disk_type", DEFAULT_DISK_TYPE))
+            window["FILL_GAPS"].update(session.get("fill_gaps", False))
+            window["ZIP_OUTPUT"].update(session.get("zip_output", False))
+            window["ZIP_META_INI"].update(session.get("zip_meta_ini", False))
 
             # restore order
             mod_sources_ordered = session.get("mod_sources_ordered", [])
             display_sources = session.get("display_sources", list(mod_sources_ordered))
             source_to_type = session.get("source_to_type", {})
+            pinned_sources = set(session.get("pinned_sources", []))
 
             used_ranges = {}
-            table_values = build_table_values_list(display_sources, used_ranges, source_to_type)
+            table_values = build_table_values_list(display_sources, used_ranges, source_to_type, pinned_sources)
             window["MODS_TABLE"].update(values=table_values, row_colors=[])
 
             append_log(window, f"Session loaded: {path}")
 
-            # compute used ranges
-            used_ranges = {}
-            for src in mod_sources_ordered:
-                folder = source_to_folder.get(src)
-                if not folder:
-                    continue
-                mod_path = os.path.join(mods_dir, folder)
-                try:
-                    jsons = collect_jsons(mod_path)
-                except RuntimeError:
-                    continue
-                if not jsons:
-                    continue
-                pri_values = []
-                for j in jsons:
-                    try:
-                        pri_values.append(int(j[4]))
-                    except Exception:
-                        pass
-                if pri_values:
-                    used_ranges[src] = f"{min(pri_values)} - {max(pri_values)}"
+            # compute used ranges (только из уже отсканированных модов)
+            conflicts.invalidate()
+            used_ranges = build_used_ranges(mod_sources_ordered, source_to_folder, mod_scans,
+                                            session.get("include_dar", True))
 
             # conflict folders
             conflict_folders = set()
@@ -967,7 +3247,7 @@ def run_mo2_mode():
                 conflict_folders.update(mods)
 
             # update table, keep current display ordering if sorted
-            update_mods_table(window, display_sources, used_ranges, sort_key=sort_column, reverse=sort_reverse, source_to_folder=source_to_folder, conflict_folders=conflict_folders)
+            update_mods_table(window, display_sources, used_ranges, sort_key=sort_column, reverse=sort_reverse, source_to_folder=source_to_folder, conflict_folders=conflict_folders, pinned_sources=pinned_sources)
 
             # log
             log_lines = []
@@ -977,9 +3257,35 @@ def run_mo2_mode():
                     log_lines.append(f" - Priority {pri}: mods: {', '.join(mods)}")
             else:
                 log_lines.append("No duplicate priorities detected.")
-            window["LOG"].update("\n".join(log_lines))
+            log_sink(window).set_lines(log_lines)
             append_log(window, "Check finished.")
 
+        if event in ("MODS_TABLE", "Export plan"):
+            # план пересчитывается на каждое изменение выделения — только по готовым сканам
+            selected = [display_sources[i] for i in safe_table_indices(values.get("MODS_TABLE"))
+                        if i < len(display_sources)]
+            reserved = [m for m in mod_scans if m not in selected] if values.get("FILL_GAPS") else []
+            plan = show_run_plan(window, values, [(m, m) for m in selected], mod_scans, reserved, pinned_sources)
+            if event == "Export plan":
+                export_plan_dialog(window, plan)
+
+        if event == "Pin / Unpin":
+            selected = [display_sources[i] for i in safe_table_indices(values.get("MODS_TABLE"))
+                        if i < len(display_sources)]
+            if not selected:
+                sg.popup_error("Select mods in the table to pin or unpin.")
+                continue
+            for src in selected:
+                if src in pinned_sources:
+                    pinned_sources.discard(src)
+                    append_log(window, f"Unpinned '{src}'")
+                else:
+                    pinned_sources.add(src)
+                    append_log(window, f"Pinned '{src}': Run keeps its current priorities")
+            update_mods_table(window, display_sources, used_ranges, source_to_folder=source_to_folder,
+                              conflict_folders=conflict_folders, source_to_type=source_to_type,
+                              overlap_folders=overlap_folders, pinned_sources=pinned_sources)
+
         if event == "Run":
             selected_rows = safe_table_indices(values.get("MODS_TABLE"))
             if not selected_rows:
@@ -1008,29 +3314,66 @@ def run_mo2_mode():
                 selected_mods = new_order
             
             include_dar = values.get("INCLUDE_DAR", True)
+            fill_gaps = values.get("FILL_GAPS")
+            zip_output, meta_ini = values.get("ZIP_OUTPUT"), values.get("ZIP_META_INI")
             
-            out_root = os.path.join(output_dir, "PriOARity_Output")
+            out_root = output_dir if zip_output else os.path.join(output_dir, "PriOARity_Output")
             os.makedirs(out_root, exist_ok=True)
 
-            log_lines = []
-            priority_counter = start_priority
-            for mod in selected_mods:
-                mod_folder_path = os.path.join(mods_dir, mod)
-                append_log(window, f"Processing mod '{mod}'")
-                try:
-                    priority_counter = copy_jsons_from_mod(mod_folder_path, out_root, mod, priority_counter, log_lines, include_dar_legacy=include_dar)
-                except RuntimeError as e:
-                    append_log(window, f"Error processing '{mod}': {e}")
-
-            window["LOG"].update("\n".join(log_lines))
+            # лог Run пишется в файл построчно, по мере работы
+            sink = log_sink(window)
+            sink.clear()
             logfile_name = os.path.join(out_root, f"mo2_prio_log_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt")
             try:
-                with open(logfile_name, "w", encoding=LOG_ENCODING) as lf:
-                    lf.write("\n".join(log_lines))
-                append_log(window, f"Done! Log saved to: {logfile_name}")
-            except Exception as e:
+                sink.open_file(logfile_name)
+            except OSError as e:
                 append_log(window, f"Failed to save log: {e}")
 
+            workers = scan_worker_count(values.get("DISK_TYPE"))
+
+            def renumber(progress, cancel):
+                # блоки считаются по актуальному содержимому выбранных модов
+                # (с индексом пересканирование неизменившегося мода — только stat())
+                for mod in selected_mods:
+                    if cancel.is_set():
+                        raise OperationCancelled()
+                    if index or mod not in mod_scans:
+                        conflicts.refresh_scan(mod_scans, mod, scan_mod(os.path.join(mods_dir, mod), index=index))
+                reserved = [m for m in mod_scans if m not in selected_mods] if fill_gaps else []
+                blocks = allocate_mod_blocks(selected_mods, mod_scans, start_priority, include_dar_legacy=include_dar,
+                                             reserved_folders=reserved, pinned_folders=pinned_sources)
+                jobs = [(m, m) for m in selected_mods]
+                if zip_output:
+                    written, errors, _ = run_archive(mods_dir, jobs, mod_scans, blocks, os.path.join(out_root, ARCHIVE_NAME),
+                                                     sink, include_dar_legacy=include_dar, progress=progress,
+                                                     cancel=cancel, meta_ini=meta_ini)
+                else:
+                    written, errors, _ = run_output(mods_dir, jobs, mod_scans, blocks, out_root, sink,
+                                                    include_dar_legacy=include_dar, progress=progress, cancel=cancel,
+                                                    workers=workers)
+                return blocks, written, errors, cancel.is_set()
+
+            status, result = run_task(window, "Run", renumber)
+            if status == "done":
+                blocks, written, errors, cancelled = result
+                for mod in selected_mods:
+                    if blocks[mod] is None:
+                        append_log(window, f"Skipping pinned mod '{mod}' (priorities kept)")
+                for mod, error in errors.items():
+                    append_log(window, f"Error processing '{mod}': {error}")
+                if cancelled:
+                    append_log(window, f"Run cancelled after {len(written)} of {len(selected_mods)} mods; the output is incomplete.")
+            saved_log = sink.close_file()
+            if status == "closed":
+                break
+            if status == "error" and isinstance(result, ValueError):
+                sg.popup_error(f"Cannot place priorities: {result}")
+                continue
+            if not report_task(window, "Run", status, result):
+                continue
+            if saved_log:
+                append_log(window, f"Done! Log saved to: {saved_log}")
+
         # Table header click for sorting
         if isinstance(event, tuple) and event[0] == "MODS_TABLE":
             # ожидаем формат ('MODS_TABLE', '+CLICKED+', (row, col))
@@ -1043,7 +3386,7 @@ def run_mo2_mode():
                         sort_reverse = False
                     sort_column = col
 
-                    table_rows = build_table_values_list(display_sources, used_ranges, source_to_type)
+                    table_rows = build_table_values_list(display_sources, used_ranges, source_to_type, pinned_sources)
 
                     def key_func(row):
                         val = row[col]
@@ -1057,17 +3400,12 @@ def run_mo2_mode():
                     table_rows.sort(key=key_func, reverse=sort_reverse)
                     display_sources = [r[1] for r in table_rows]
 
-                    # пересветка конфликтов
-                    conflict_folders = set()
+                    # пересветка конфликтов (из кэша, без пересчёта)
+                    conflict_folders, overlap_folders = set(), set()
                     include_dar = values.get("INCLUDE_DAR", True)
                     try:
-                        all_folders = [
-                            source_to_folder.get(s)
-                            for s in mod_sources_ordered
-                            if source_to_folder.get(s)
-                        ]
-                        for pri, mods in find_priority_conflicts(mods_dir, all_folders, include_dar_legacy=include_dar):
-                            conflict_folders.update(mods)
+                        _, _, conflict_folders, overlap_folders, _ = conflicts.get(
+                            mods_dir, mod_sources_ordered, source_to_folder, mod_scans, include_dar)
                     except Exception:
                         pass
 
@@ -1079,44 +3417,65 @@ def run_mo2_mode():
                         reverse=sort_reverse,
                         source_to_folder=source_to_folder,
                         conflict_folders=conflict_folders,
-                        source_to_type=source_to_type
+                        source_to_type=source_to_type,
+                        overlap_folders=overlap_folders,
+                        pinned_sources=pinned_sources
                     )
 
 
-    # unreachable
+    # окно закрыто во время фоновой задачи
+    if index:
+        index.close()
+    return "exit"
 
 # ==== Run Vortex mode ====
 
 def run_vortex_mode():
+    import FreeSimpleGUI as sg
     window = build_common_ui(title="PriOARity — Vortex mode", input_label="vortex.deployment.msgpack", folder_mode=False)
+    index = open_animation_index()
 
     mods_dir = None
     mod_sources_ordered = []
     display_sources = []
     source_to_folder = {}
     source_to_type = {}  # source -> mod_type string
+    deploy_sources = {}  # source -> DeploySource (из записей деплоя, без обращения к диску)
+    mod_scans = {}  # folder -> ModScan (результат последнего Load/Check)
+    pinned_sources = set()  # закреплённые моды: Run не меняет их приоритеты
+    conflicts = ConflictCache()  # анализ конфликтов для текущих mod_scans
+    conflict_folders, overlap_folders = set(), set()
     used_ranges = {}
     sort_column = None
     sort_reverse = False
 
     while True:
+        log_sink(window).flush()
         event, values = window.read()
         if event in (sg.WIN_CLOSED, "Exit"):
             window.close()
+            if index:
+                index.close()
             return "exit"
         if event == "Back":
             window.close()
+            if index:
+                index.close()
             return "back"
 
         if event == "Load mods":
-            window["LOG"].update("")
+            log_sink(window).clear()
             used_ranges = {}
             sort_column = None
             sort_reverse = False
             source_to_folder = {}
             source_to_type = {}
+            mod_scans = {}
+            conflict_folders, overlap_folders = set(), set()
+            conflicts.invalidate()
             mod_sources_ordered = []
             display_sources = []
+            deploy_sources = {}
 
             deployment_file = values.get("PROFILE_OR_DEPLOY") or ""
             if not deployment_file or not os.path.exists(deployment_file):
@@ -1147,29 +3506,46 @@ def run_vortex_mode():
                 append_log(window, f"Using staging folder: {mods_dir}")
 
             entries = deployment_data.get("entries", []) or []
-            append_log(window, f"Total deployment entries found: {len(entries)}")
+            append_log(window, f"Total deployment entries found: {deployment_data.get('entry_count', len(entries))}"
+                               f" ({len(entries)} OAR/DAR)")
 
-            mod_sources_ordered = extract_ordered_sources_from_entries(entries)
-            append_log(window, f"Detected {len(mod_sources_ordered)} distinct OAR/DAR sources in deployment (in order).")
+            deploy_sources = summarize_deployment_sources(entries)
+            mod_sources_ordered = list(deploy_sources)
+            append_log(window, f"Detected {len(mod_sources_ordered)} distinct OAR/DAR sources in deployment (in order): "
+                               f"{sum(d.oar_paths for d in deploy_sources.values())} OAR paths, "
+                               f"{sum(d.dar_paths for d in deploy_sources.values())} DAR paths.")
 
             # map sources -> folders if staging known (progress meter)
             source_to_folder.clear()
             source_to_type.clear()
             if mods_dir:
-                try:
-                    _ = [d for d in os.listdir(mods_dir) if os.path.isdir(os.path.join(mods_dir, d))]
-                except Exception as e:
-                    append_log(window, f"Error listing staging folder contents: {e}")
-                total = len(mod_sources_ordered)
+                resolver = StagingResolver(mods_dir)
+                if resolver.error:
+                    append_log(window, f"Error listing staging folder contents: {resolver.error}")
                 include_dar = values.get("INCLUDE_DAR", True)
-                for i, src in enumerate(mod_sources_ordered, 1):
-                    sg.OneLineProgressMeter("Mapping sources", i, total, "MAPSRC", f"Scanning {i}/{total} sources...")
-                    folder = find_mod_folder_by_source(mods_dir, src)
+
+                def map_source(src):
+                    # тип и OAR-конфиги — по путям из деплоя; с диска только config.json вне индекса
+                    folder = resolver.resolve(src)
+                    scan = (scan_mod_from_deployment(os.path.join(mods_dir, folder), deploy_sources[src].paths,
+                                                     index=index) if folder else None)
+                    return folder, scan
+
+                # поиск папки + сканирование параллельно, вывод — в исходном порядке источников
+                workers = scan_worker_count(values.get("DISK_TYPE"))
+                status, mapped = run_task(window, "Mapping sources", lambda progress, cancel: run_parallel(
+                    map_source, mod_sources_ordered, workers=workers, progress=progress, cancel=cancel))
+                if status == "closed":
+                    break
+                if not report_task(window, "Mapping sources", status, mapped):
+                    mod_sources_ordered = []
+                    continue
+                for src, (folder, scan) in zip(mod_sources_ordered, mapped):
                     if folder:
                         source_to_folder[src] = folder
-                        # detect mod type
-                        mod_path = os.path.join(mods_dir, folder)
-                        mod_type = detect_mod_type(mod_path)
+                        # detect mod type (результат сканирования сохраняем для Check/Run)
+                        mod_scans[folder] = scan
+                        mod_type = scan.mod_type
                         if mod_type and (include_dar or mod_type in (ModType.OAR, ModType.MIXED)):
                             source_to_type[src] = mod_type
                             append_log(window, f"Mapped source -> folder: '{src}' → '{folder}' [{mod_type}]")
@@ -1179,9 +3555,12 @@ def run_vortex_mode():
                             append_log(window, f"Mapped source -> folder: '{src}' → '{folder}' (no animations)")
                     else:
                         append_log(window, f"Could not map source to folder (staging scan): '{src}'")
+                    if src in resolver.ambiguous:
+                        append_log(window, f"  Ambiguous match for '{src}': {', '.join(resolver.ambiguous[src])}"
+                                           f" (using '{folder}')")
 
             display_sources = list(mod_sources_ordered)
-            table_values = build_table_values_list(display_sources, used_ranges, source_to_type)
+            table_values = build_table_values_list(display_sources, used_ranges, source_to_type, pinned_sources)
             try:
                 window["MODS_TABLE"].update(values=table_values, row_colors=[])
             except Exception:
@@ -1216,49 +3595,27 @@ def run_vortex_mode():
                 append_log(window, "No mapped folders available for scanning.")
                 continue
 
-            try:
-                duplicate_conflicts = find_priority_conflicts(mods_dir, all_folders_ordered, include_dar_legacy=include_dar)
-            except Exception as e:
-                append_log(window, f"Error while scanning priorities: {e}")
+            workers = scan_worker_count(values.get("DISK_TYPE"))
+            # один свежий проход по каждому моду, дальше всё считается из mod_scans
+            status, new_scans = run_task(window, "Checking mods", lambda progress, cancel: scan_mods(
+                mods_dir, all_folders_ordered, index=index, workers=workers, progress=progress, cancel=cancel))
+            if status == "closed":
+                break
+            if status == "error":
+                append_log(window, f"Error while scanning priorities: {new_scans}")
                 continue
-
-            # compute used ranges per source (scan per canonical source order)
-            used_ranges = {}
-            for src in mod_sources_ordered:
-                folder = source_to_folder.get(src)
-                if not folder:
-                    continue
-                mod_path = os.path.join(mods_dir, folder)
-                
-                # OAR priorities
-                try:
-                    jsons = collect_jsons(mod_path)
-                    pri_values = [int(j[4]) for j in jsons if "priority" in j[3]]
-                    if pri_values:
-                        used_ranges[src] = f"{min(pri_values)} - {max(pri_values)}"
-                except RuntimeError:
-                    pass
-                
-                # DAR Legacy priorities
-                if include_dar:
-                    dar_entries = collect_dar_legacy_entries(mod_path)
-                    dar_pri_values = [int(e[4]) for e in dar_entries]
-                    if dar_pri_values:
-                        dar_range = f"{min(dar_pri_values)} - {max(dar_pri_values)}"
-                        if src in used_ranges:
-                            used_ranges[src] = f"{used_ranges[src]} + {dar_range} (DAR)"
-                        else:
-                            used_ranges[src] = f"{dar_range} (DAR)"
-
-            # conflict folders
-            conflict_folders = set()
-            for pri, mods in duplicate_conflicts:
-                conflict_folders.update(mods)
+            if not report_task(window, "Check", status, new_scans):
+                continue
+            mod_scans = new_scans
+            conflicts.invalidate()
+            (duplicate_conflicts, range_conflicts, conflict_folders, overlap_folders,
+             used_ranges) = conflicts.get(mods_dir, mod_sources_ordered, source_to_folder, mod_scans, include_dar)
 
             # update table (keep current display ordering)
             update_mods_table(window, display_sources, used_ranges, sort_key=sort_column, 
                             reverse=sort_reverse, source_to_folder=source_to_folder, 
-                            conflict_folders=conflict_folders, source_to_type=source_to_type)
+                            conflict_folders=conflict_folders, source_to_type=source_to_type,
+                            overlap_folders=overlap_folders, pinned_sources=pinned_sources)
 
             # log
             log_lines = []
@@ -1271,9 +3628,50 @@ def run_vortex_mode():
                     log_lines.append(f" - Priority {pri}: folders: {display_mods}; sources: {display_srcs}")
             else:
                 log_lines.append("✅ No duplicate priorities detected.")
-            window["LOG"].update("\n".join(log_lines))
+            if range_conflicts:
+                log_lines.append("⚠️ Overlapping priority ranges (load order may not be respected):")
+                log_lines.extend(format_range_conflict(c) for c in range_conflicts)
+            log_sink(window).set_lines(log_lines)
             append_log(window, "Duplicate check finished.")
 
+        if event in ("MODS_TABLE", "Export plan"):
+            # план пересчитывается на каждое изменение выделения — только по готовым сканам
+            selected = [display_sources[i] for i in safe_table_indices(values.get("MODS_TABLE"))
+                        if i < len(display_sources)]
+            jobs = [(src, source_to_folder[src]) for src in selected if source_to_folder.get(src)]
+            selected_folders = {folder for _, folder in jobs}
+            reserved = [f for f in mod_scans if f not in selected_folders] if values.get("FILL_GAPS") else []
+            pinned_folders = {source_to_folder[s] for s in pinned_sources if s in source_to_folder}
+            if event == "Export plan":
+                # экспорт должен совпадать с тем, что запишет Run: сканы по деплою заменяются сканами с диска
+                status = refresh_provisional_scans(window, mods_dir, mod_scans, [f for _, f in jobs] + reserved,
+                                                   conflicts, index=index,
+                                                   workers=scan_worker_count(values.get("DISK_TYPE")))
+                if status == "closed":
+                    break
+                if status != "done":
+                    continue
+            plan = show_run_plan(window, values, jobs, mod_scans, reserved, pinned_folders)
+            if event == "Export plan":
+                export_plan_dialog(window, plan)
+
+        if event == "Pin / Unpin":
+            selected = [display_sources[i] for i in safe_table_indices(values.get("MODS_TABLE"))
+                        if i < len(display_sources)]
+            if not selected:
+                sg.popup_error("Select mods in the table to pin or unpin.")
+                continue
+            for src in selected:
+                if src in pinned_sources:
+                    pinned_sources.discard(src)
+                    append_log(window, f"Unpinned '{src}'")
+                else:
+                    pinned_sources.add(src)
+                    append_log(window, f"Pinned '{src}': Run keeps its current priorities")
+            update_mods_table(window, display_sources, used_ranges, source_to_folder=source_to_folder,
+                              conflict_folders=conflict_folders, source_to_type=source_to_type,
+                              overlap_folders=overlap_folders, pinned_sources=pinned_sources)
+
         if event == "Run":
             selected_rows = safe_table_indices(values.get("MODS_TABLE"))
             if not selected_rows:
@@ -1319,33 +3717,79 @@ def run_vortex_mode():
                 continue
 
             include_dar = values.get("INCLUDE_DAR", True)
-            
-            out_root = os.path.join(output_dir, "PriOARity_Output")
-            os.makedirs(out_root, exist_ok=True)
+            fill_gaps = values.get("FILL_GAPS")
 
-            log_lines = []
-            priority_counter = start_priority
+            present = []
             for src, folder in selected_mapped_folders:
                 mod_folder_path = os.path.join(mods_dir, folder)
                 if not os.path.exists(mod_folder_path):
                     append_log(window, f"Skipping missing folder '{mod_folder_path}' for source '{src}'")
                     continue
-                append_log(window, f"Processing source '{src}' -> folder '{folder}'")
-                try:
-                    priority_counter = copy_jsons_from_mod(mod_folder_path, out_root, src, priority_counter, log_lines, include_dar_legacy=include_dar)
-                except RuntimeError as e:
-                    append_log(window, f"Error processing '{src}': {e}")
+                present.append((src, folder))
+            selected_folders = [folder for _, folder in present]
+            pinned_folders = {source_to_folder[s] for s in pinned_sources if s in source_to_folder}
+            zip_output, meta_ini = values.get("ZIP_OUTPUT"), values.get("ZIP_META_INI")
+            
+            out_root = output_dir if zip_output else os.path.join(output_dir, "PriOARity_Output")
+            os.makedirs(out_root, exist_ok=True)
 
-            log_text = "\n".join(log_lines) if log_lines else "(no json files found / nothing processed)"
-            window["LOG"].update(log_text)
+            # лог Run пишется в файл построчно, по мере работы
+            sink = log_sink(window)
+            sink.clear()
             logfile_name = os.path.join(out_root, f"vortex_prio_log_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt")
             try:
-                with open(logfile_name, "w", encoding=LOG_ENCODING) as lf:
-                    lf.write(log_text)
-                append_log(window, f"Done! Log saved to: {logfile_name}")
-            except Exception as e:
+                sink.open_file(logfile_name)
+            except OSError as e:
                 append_log(window, f"Failed to save log file: {e}")
 
+            workers = scan_worker_count(values.get("DISK_TYPE"))
+
+            def renumber(progress, cancel):
+                # блоки считаются по актуальному содержимому выбранных модов
+                # (с индексом пересканирование неизменившегося мода — только stat())
+                reserved = [f for f in mod_scans if f not in selected_folders] if fill_gaps else []
+                # занятые диапазоны остальных модов тоже не должны браться из деплоя
+                provisional = [f for f in reserved if mod_scans[f] is not None and mod_scans[f].from_manifest]
+                for folder in selected_folders + provisional:
+                    if cancel.is_set():
+                        raise OperationCancelled()
+                    if index or folder not in mod_scans or mod_scans[folder].from_manifest:
+                        conflicts.refresh_scan(mod_scans, folder, scan_mod(os.path.join(mods_dir, folder), index=index))
+                blocks = allocate_mod_blocks(selected_folders, mod_scans, start_priority, include_dar_legacy=include_dar,
+                                             reserved_folders=reserved, pinned_folders=pinned_folders)
+                if zip_output:
+                    written, errors, _ = run_archive(mods_dir, present, mod_scans, blocks, os.path.join(out_root, ARCHIVE_NAME),
+                                                     sink, include_dar_legacy=include_dar, progress=progress,
+                                                     cancel=cancel, meta_ini=meta_ini)
+                else:
+                    written, errors, _ = run_output(mods_dir, present, mod_scans, blocks, out_root, sink,
+                                                    include_dar_legacy=include_dar, progress=progress, cancel=cancel,
+                                                    workers=workers)
+                return blocks, written, errors, cancel.is_set()
+
+            status, result = run_task(window, "Run", renumber)
+            if status == "done":
+                blocks, written, errors, cancelled = result
+                for src, folder in present:
+                    if blocks[folder] is None:
+                        sink.append(f"Skipping pinned source '{src}' (priorities kept)")
+                    elif folder in errors:
+                        sink.append(f"Error processing '{src}': {errors[folder]}")
+                if cancelled:
+                    sink.append(f"Run cancelled after {len(written)} of {len(present)} mods; the output is incomplete.")
+                if not sink.file_lines and not sink.lines:
+                    sink.append("(no json files found / nothing processed)")
+            saved_log = sink.close_file()
+            if status == "closed":
+                break
+            if status == "error" and isinstance(result, ValueError):
+                sg.popup_error(f"Cannot place priorities: {result}")
+                continue
+            if not report_task(window, "Run", status, result):
+                continue
+            if saved_log:
+                append_log(window, f"Done! Log saved to: {saved_log}")
+
         # Table header click for sorting
         if isinstance(event, tuple) and event[0] == "MODS_TABLE":
             try:
@@ -1362,7 +3806,7 @@ def run_vortex_mode():
                     sort_reverse = False
                 sort_column = col
                 # build rows and sort
-                table_rows = build_table_values_list(display_sources, used_ranges, source_to_type)
+                table_rows = build_table_values_list(display_sources, used_ranges, source_to_type, pinned_sources)
                 def key_func(row):
                     val = row[col]
                     if col == 0:
@@ -1382,23 +3826,25 @@ def run_vortex_mode():
                     return str(val).lower()
                 table_rows.sort(key=key_func, reverse=sort_reverse)
                 display_sources = [r[1] for r in table_rows]
-                # recompute conflict_folders (quick scan)
-                conflict_folders = set()
+                # conflict_folders from the cache (scans of the last Load/Check, nothing is recomputed;
+                # после Load — предварительно, по сканам из деплоя)
                 include_dar = values.get("INCLUDE_DAR", True)
                 try:
-                    all_folders = [source_to_folder.get(s) for s in mod_sources_ordered if source_to_folder.get(s)]
-                    duplicate_conflicts = find_priority_conflicts(mods_dir, [f for f in all_folders if f], include_dar_legacy=include_dar)
-                    for pri, mods in duplicate_conflicts:
-                        conflict_folders.update(mods)
+                    _, _, conflict_folders, overlap_folders, _ = conflicts.get(
+                        mods_dir, mod_sources_ordered, source_to_folder, mod_scans, include_dar)
                 except Exception:
-                    conflict_folders = set()
-                update_mods_table(window, display_sources, used_ranges, sort_key=col, reverse=sort_reverse, source_to_folder=source_to_folder, conflict_folders=conflict_folders, source_to_type=source_to_type)
+                    conflict_folders, overlap_folders = set(), set()
+                update_mods_table(window, display_sources, used_ranges, sort_key=col, reverse=sort_reverse, source_to_folder=source_to_folder, conflict_folders=conflict_folders, source_to_type=source_to_type, overlap_folders=overlap_folders, pinned_sources=pinned_sources)
 
-    # unreachable
+    # окно закрыто во время фоновой задачи
+    if index:
+        index.close()
+    return "exit"
 
 # ==== Main launcher ====
 
 def main():
+    import FreeSimpleGUI as sg
     sg.change_look_and_feel("DarkGrey9")
     while True:
         mode = choose_mode()
@@ -1416,6 +3862,9 @@ def main():
     print("Exiting PriOARity.")
 
 if __name__ == "__main__":
+    # нужно для пула процессов в собранном PriOARity.exe
+    import multiprocessing
+    multiprocessing.freeze_support()
     try:
         main()
     except Exception as e:
@@ -0,0 +1,85 @@
+# test_deployment.py
+"""
+load_vortex_deployment (потоковый разбор) против _load_vortex_deployment_full на одних и тех же
+файлах деплоя, с C-расширением msgpack и с чистым Python (msgpack.fallback).
+
+    python -m pytest -q test_deployment.py
+"""
+import random
+
+import msgpack
+import msgpack.fallback
+import pytest
+
+import prioarity_complete as core
+
+OAR = "meshes\\actors\\character\\animations\\OpenAnimationReplacer\\Pack\\config.json"
+DAR = "meshes\\actors\\character\\animations\\DynamicAnimationReplacer\\_CustomConditions\\100\\_conditions.txt"
+
+CASES = [
+    {"stagingPath": "S", "targetPath": "T",
+     "files": [{"relPath": OAR, "source": "A"}, {"relPath": "textures\\a.dds", "source": "B"}]},
+    {"files": [{"foo": 1}, {"relPath": OAR, "source": "A"}], "stagingPath": "S"},
+    {"entries": [1, {"relPath": DAR, "source": "A"}]},
+    {"files": None, "entries": [{"x": 1}, {"relPath": OAR, "source": "E"}]},
+    {"files": {"relPath": OAR, "source": "A"}, "entries": [{"relPath": OAR, "source": "E"}]},
+    {"files": 5, "entries": [{"x": 1}, {"relPath": OAR, "source": "E"}]},
+    {"a": {"b": [{"relPath": OAR, "source": "N"}]}, "files": [{"relPath": OAR, "source": "F"}]},
+    {"a": [[{"q": 1}], {"relpath": OAR, "Source": "Z"}], "targetPath": "T"},
+    [{"relPath": OAR, "source": "L"}, {"relPath": "tex", "source": "M"}, 7],
+    {"files": [{"x": 1}, {"relPath": OAR, "mod": "M2", "stagingPath": "in-row"}]},
+    {"files": [{"relPath": OAR, "source": "A"}, {"relPath": OAR, "source": "B", "meta": {"stagingPath": "deep"}}]},
+    {"files": []}, {}, 3,
+    # контейнеры в значениях ключей записи и путей
+    {"files": [{"relpath": {"targetPath": OAR}}]},
+    {"mod": None, "stagingPath": {"relpath": [[1]], "targetPath": [["x"], [OAR, 1]]}},
+    [True, {"relpath": {"stagingPath": {"relPath": None, "relpath": "B"}}}, []],
+    {"files": [{"relPath": [{"relPath": OAR, "source": "inner"}], "source": "outer"}]},
+    [{"relPath": OAR, "source": "A", "x": [{"relPath": OAR, "source": "nested"}]}],
+    {"x": [{"relPath": OAR, "source": {"stagingPath": "src"}}], "stagingPath": None, "targetPath": "T"},
+]
+
+KEYS = ["relPath", "relpath", "source", "Source", "mod", "stagingPath", "targetPath",
+        "files", "entries", "x", "y"]
+SCALARS = [None, 1, True, "s", "A", "B", OAR, DAR]
+
+def random_deployment(rnd, depth=0):
+    t = rnd.random()
+    if depth > 4 or t < 0.3:
+        return rnd.choice(SCALARS)
+    if t < 0.65:
+        return {rnd.choice(KEYS): random_deployment(rnd, depth + 1) for _ in range(rnd.randint(0, 5))}
+    return [random_deployment(rnd, depth + 1) for _ in range(rnd.randint(0, 5))]
+
+IMPLEMENTATIONS = ["fallback"]
+if msgpack.Unpacker is not msgpack.fallback.Unpacker:
+    IMPLEMENTATIONS.append("c")
+
+@pytest.fixture(params=IMPLEMENTATIONS)
+def unpacker(request, monkeypatch):
+    if request.param == "fallback":
+        monkeypatch.setattr(msgpack, "Unpacker", msgpack.fallback.Unpacker)
+    return request.param
+
+def load_both(tmp_path, data):
+    path = tmp_path / "vortex.deployment.msgpack"
+    path.write_bytes(msgpack.packb(data))
+    return core.load_vortex_deployment(str(path)), core._load_vortex_deployment_full(str(path))
+
+@pytest.mark.parametrize("data", CASES)
+def test_stream_matches_full(tmp_path, unpacker, data):
+    stream, full = load_both(tmp_path, data)
+    assert stream == full
+
+def test_stream_matches_full_random(tmp_path, unpacker):
+    rnd = random.Random(2024)
+    for _ in range(2000):
+        data = random_deployment(rnd)
+        stream, full = load_both(tmp_path, data)
+        assert stream == full, data
+
+def test_stream_finds_entries(tmp_path, unpacker):
+    stream, _ = load_both(tmp_path, CASES[0])
+    assert stream["stagingPath"] == "S"
+    assert stream["entries"] == [{"relPath": OAR, "source": "A"}]
+    assert stream["entry_count"] == 2